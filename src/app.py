@@ -2,27 +2,20 @@
 import sys
 import argparse
 import os
-from dotenv import load_dotenv
 from utils import Llm, Translate
+from utils.config import ensure_env_loaded, get_config
 
 # --- Step 1: Load environment variables from .env file ---
-# Assuming the .env file is in the project root directory (one level up from src)
-# We need to find the project root. A common way is to look for a marker file
-# like .env itself, or requirements.txt, or .git.
-# For simplicity here, we'll assume the script is run from the project root
-# or that the .env file is directly accessible relative to the script's location.
-# A more robust way might involve finding the project root dynamically.
-# Let's assume .env is one directory up from src/app.py
+# The .env file lives in the project root (one level up from src).
+# Loading is delegated to utils.config, which guarantees the file is
+# parsed exactly once per process no matter how many call sites ask.
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
 
-if os.path.exists(dotenv_path):
-    load_dotenv(dotenv_path)
-    print(f"Loaded environment variables from {dotenv_path}")
-else:
+if not os.path.exists(dotenv_path):
     print(f"Warning: .env file not found at {dotenv_path}. Ensure API keys are set in your environment.")
+ensure_env_loaded(dotenv_path)
 
-# Now you can access environment variables using os.environ.get() or os.getenv()
-# The Llm class automatically reads these using os.environ.get()
+# Environment-derived LLM settings are read once and cached by get_config()
 
 
 # --- Step 2: Call the LLM as a sample ---
@@ -63,17 +56,14 @@ def main():
 
 
 def process_novel_translation(input_path):
-    llmprovider = os.getenv('LLM_PROVIDER', 'gemini')
-    llmtoken = os.getenv('LLM_TOKEN', None)
-    llmurl = os.getenv('LLM_URL', None)
-    llmmodel = os.getenv('LLM_MODEL', None)
-    llmsys = os.getenv('LLM_PROMPT', None)
+    cfg = get_config() # Cached snapshot of the LLM_* environment variables
 
-    # Example 1: Using Gemini (default provider)
-    llm = Llm(provider=llmprovider, url=llmurl, token=llmtoken, model=llmmodel) # Uses GEMINI_API_KEY from environment
+    # cache=True: identical chunks (retries, reruns of the same file) are
+    # served from the on-disk response cache instead of a new API call
+    llm = Llm(cache=True, **cfg.llm_kwargs()) # Uses GEMINI_API_KEY from environment if no token set
 
     # Create a Translate instance
-    translator = Translate(llm, llmsys)
+    translator = Translate(llm, cfg.sysprompt)
 
     # Run the process with the sample file
     output_file = translator.run(input_path)
@@ -94,17 +84,13 @@ def sample():
     """
     print("\n--- LLM Sample Call ---")
 
-    llmprovider = os.getenv('LLM_PROVIDER', 'gemini')
-    llmtoken = os.getenv('LLM_TOKEN', None)
-    llmurl = os.getenv('LLM_URL', None)
-    llmmodel = os.getenv('LLM_MODEL', None)
-    llmsys = os.getenv('LLM_PROMPT', None)
+    cfg = get_config()
 
     # Example 1: Using Gemini (default provider)
     try:
-        print(f"\nCalling {llmprovider}...")
-        llm = Llm(provider=llmprovider, url=llmurl, token=llmtoken) # Uses GEMINI_API_KEY from environment
-        response = llm.run(model=llmmodel, sysprompt=llmsys, userprompt="What is the capital of Italy?")
+        print(f"\nCalling {cfg.provider}...")
+        llm = Llm(provider=cfg.provider, url=cfg.url, token=cfg.token) # Uses GEMINI_API_KEY from environment
+        response = llm.run(model=cfg.model, sysprompt=cfg.sysprompt, userprompt="What is the capital of Italy?")
         print(f"Gemini Response: {response}")
     except Exception as e:
         print(f"Gemini call failed: {e}")
@@ -5,6 +5,8 @@
 from .llm import Llm
 from .translate import Translate
 from .common import format_dict_for_debug
+from .config import LlmConfig, get_config, ensure_env_loaded
+from .cache import LlmCache
 # You can add other imports here if you add more utility modules
 # from .another_util import AnotherUtil
 
@@ -12,6 +14,10 @@ from .common import format_dict_for_debug
 __all__ = [
     "Llm",
     "Translate",
-    "format_dict_for_debug"
+    "format_dict_for_debug",
+    "LlmConfig",
+    "get_config",
+    "ensure_env_loaded",
+    "LlmCache"
     # "AnotherUtil",
 ]
\ No newline at end of file
@@ -0,0 +1,65 @@
+# src/utils/cache.py
+import hashlib
+import json
+import os
+import time
+from typing import Optional, Tuple
+
+
+class LlmCache:
+    """
+    Exact-match on-disk cache for LLM responses.
+
+    Keys are a blake2b hash of (model, sysprompt, userprompt, assistprompt),
+    values are the (error, text) tuples produced by Llm.extract_response.
+    Entries are stored one small JSON file per key under cache_dir, so
+    re-translating an unchanged paragraph (retries, incremental edits,
+    re-runs) costs a local file read instead of a full API call.
+    """
+
+    def __init__(self, cache_dir: str = ".llm_cache", ttl: Optional[float] = 7 * 24 * 3600):
+        """
+        Args:
+            cache_dir (str): Directory holding the cached responses.
+            ttl (Optional[float]): Max age of an entry in seconds; None disables expiry.
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(model: Optional[str], sysprompt: Optional[str], userprompt: Optional[str], assistprompt: Optional[str] = None) -> str:
+        """Builds the stable hash key for one request's identifying fields."""
+        blob = json.dumps(
+            {"model": model, "sys": sysprompt, "user": userprompt, "assist": assistprompt},
+            sort_keys=True, ensure_ascii=False
+        ).encode('utf-8')
+        return hashlib.blake2b(blob, digest_size=16).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        """
+        Looks up a cached response.
+
+        Returns:
+            The cached (error, text) tuple, or None on miss/expiry/corruption.
+        """
+        path = self._path(key)
+        try:
+            if self.ttl is not None and time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data.get('error'), data.get('text')
+        except (OSError, ValueError):
+            return None # Treat missing or unreadable entries as a miss
+
+    def put(self, key: str, error: Optional[str], text: Optional[str]):
+        """Stores a response. Write failures are ignored (cache is best-effort)."""
+        try:
+            with open(self._path(key), 'w', encoding='utf-8') as f:
+                json.dump({'error': error, 'text': text}, f, ensure_ascii=False)
+        except OSError:
+            pass
@@ -1,39 +1,73 @@
+from collections import deque
 
 
-def format_dict_for_debug(data, max_len: int = 20, head_len: int = 10, tail_len: int = 10):
+class _Lit:
+    """Already-formatted literal token on the worklist (brackets, separators)."""
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+
+def format_dict_for_debug(data, max_len: int = 20, head_len: int = 10, tail_len: int = 10, max_nodes: int = 500) -> str:
     """
-    Recursively formats a dictionary or list for debugging, truncating long string values.
+    Formats a dictionary or list for debugging, truncating long string values.
+
+    Walks the structure iteratively (no recursion) and emits a repr-style
+    string directly instead of building a parallel dict/list, so the work done
+    is bounded by max_nodes regardless of how large the payload is — important
+    when payloads contain multi-megabyte base64 image blobs.
 
     Args:
-        data: The dictionary or list to format.
+        data: The dictionary, list or scalar to format.
         max_len: The maximum length a string can be before truncation.
         head_len: The number of characters to show from the beginning of a long string.
         tail_len: The number of characters to show from the end of a long string.
+        max_nodes: Budget of nodes to visit before emitting "…(truncated)".
 
     Returns:
-        A new dictionary or list with long strings truncated, or the original value
-        if it's not a dict or list.
+        A repr-style string representation with long strings truncated.
     """
-    if isinstance(data, dict):
-        formatted_data = {}
-        for key, value in data.items():
-            formatted_data[key] = format_dict_for_debug(value, max_len, head_len, tail_len) # Recurse on value
-        return formatted_data
-    elif isinstance(data, list):
-        formatted_list = []
-        for item in data:
-            formatted_list.append(format_dict_for_debug(item, max_len, head_len, tail_len)) # Recurse on list item
-        return formatted_list
-    elif isinstance(data, str) and len(data) > max_len:
-        # Apply truncation logic to the string
-        if head_len + tail_len < len(data):
-             return data[:head_len] + "..." + data[-tail_len:]
+    out = []
+    # LIFO worklist: real nodes are formatted when popped, _Lit tokens are
+    # emitted verbatim. Children are pushed in reverse so output order is kept.
+    stack = deque([data])
+    budget = max_nodes
+
+    while stack:
+        node = stack.pop()
+        if isinstance(node, _Lit):
+            out.append(node.text)
+            continue
+
+        budget -= 1
+        if budget < 0:
+            out.append("…(truncated)")
+            break
+
+        if isinstance(node, dict):
+            out.append("{")
+            stack.append(_Lit("}"))
+            items = list(node.items())
+            for i, (key, value) in zip(range(len(items) - 1, -1, -1), reversed(items)):
+                stack.append(value)
+                stack.append(_Lit(f"{key!r}: "))
+                if i > 0:
+                    stack.append(_Lit(", "))
+        elif isinstance(node, list):
+            out.append("[")
+            stack.append(_Lit("]"))
+            for i, item in zip(range(len(node) - 1, -1, -1), reversed(node)):
+                stack.append(item)
+                if i > 0:
+                    stack.append(_Lit(", "))
+        elif isinstance(node, str) and len(node) > max_len:
+            # Truncate long strings to head...tail so blobs stay readable
+            if head_len + tail_len < len(node):
+                out.append(repr(node[:head_len] + "..." + node[-tail_len:]))
+            else:
+                out.append(repr(node[:max_len] + "..."))
         else:
-             # Simple truncation if head+tail >= len(data) but len(data) > max_len
-             # This case handles strings that are longer than max_len but not long enough
-             # for the head+tail truncation to be shorter than the original string.
-             # We still want to truncate them to max_len for brevity.
-             return data[:max_len] + "..."
-    else:
-        # Return other data types as is
-        return data
\ No newline at end of file
+            out.append(repr(node))
+
+    return "".join(out)
@@ -0,0 +1,67 @@
+# src/utils/config.py
+import os
+import functools
+from dataclasses import dataclass
+from typing import Optional
+
+# Ensure load_dotenv runs exactly once per process, even if ensure_env_loaded
+# is called from several entry points.
+_LOADED = False
+
+
+def ensure_env_loaded(dotenv_path: Optional[str] = None):
+    """
+    Loads the .env file into os.environ exactly once per process.
+
+    Args:
+        dotenv_path (Optional[str]): Path to the .env file. Defaults to the
+                                     project root (one level up from src/).
+    """
+    global _LOADED
+    if _LOADED:
+        return
+    _LOADED = True
+
+    if dotenv_path is None:
+        dotenv_path = os.path.join(os.path.dirname(__file__), '..', '..', '.env')
+
+    if os.path.exists(dotenv_path):
+        from dotenv import load_dotenv
+        load_dotenv(dotenv_path, override=False)
+
+
+@dataclass(frozen=True)
+class LlmConfig:
+    """Frozen snapshot of the LLM-related environment variables."""
+    provider: str
+    token: Optional[str]
+    url: Optional[str]
+    model: Optional[str]
+    sysprompt: Optional[str]
+
+    def llm_kwargs(self) -> dict:
+        """Returns the kwargs for constructing an Llm instance."""
+        return {
+            "provider": self.provider,
+            "url": self.url,
+            "token": self.token,
+            "model": self.model,
+        }
+
+
+@functools.lru_cache(maxsize=1)
+def get_config() -> LlmConfig:
+    """
+    Reads the LLM configuration from the environment once and caches it.
+
+    Returns:
+        LlmConfig: The cached, immutable configuration.
+    """
+    ensure_env_loaded()
+    return LlmConfig(
+        provider=os.environ.get('LLM_PROVIDER', 'gemini'),
+        token=os.environ.get('LLM_TOKEN'),
+        url=os.environ.get('LLM_URL'),
+        model=os.environ.get('LLM_MODEL'),
+        sysprompt=os.environ.get('LLM_PROMPT'),
+    )
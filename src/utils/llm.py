@@ -1,10 +1,80 @@
 # src/utils/llm.py
-import requests
 import json
 import os
-import base64 # Needed for image encoding
+import asyncio
+import functools
+import itertools
+import random
+import re
+import threading
+import time
 from typing import List, Dict, Any, Optional, Union
 
+# requests is only needed once an Llm instance exists; deferring the import
+# (like aiohttp below) keeps cold-start cheap for invocations that never make
+# a network call. It lands in sys.modules on first Llm(), so later lookups
+# are free.
+requests = None
+
+
+def _load_requests():
+    """Imports requests (and pooling helpers) on first use."""
+    global requests
+    if requests is None:
+        import requests
+    return requests
+
+
+# pybase64 offers SIMD-vectorized (SSSE3/AVX2) base64, 3-10x faster on large
+# images; it exposes the same b64encode API, so fall back to stdlib if absent.
+# Resolved on first encode so image-free runs never pay for the import.
+_b64 = None
+
+
+def _load_b64():
+    """Resolves the base64 backend (pybase64 or stdlib) on first use."""
+    global _b64
+    if _b64 is None:
+        try:
+            import pybase64 as _b64
+        except ImportError:
+            import base64 as _b64
+    return _b64
+
+# httpx enables HTTP/2: many in-flight requests multiplex over a single TLS
+# connection instead of one TCP connection each. Optional; requests remains
+# the fallback transport when httpx is not installed.
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from .cache import LlmCache
+from .common import format_dict_for_debug
+from .ratelimit import AsyncTokenBucket
+
+# orjson is a C-implemented JSON codec, 2-5x faster than stdlib and returning
+# bytes directly (no separate .encode() pass inside requests). This matters for
+# vision payloads carrying large base64 blobs. Fall back to stdlib if missing.
+try:
+    import orjson
+
+    def _json_dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def _json_loads(data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+    _JSONDecodeError = orjson.JSONDecodeError
+except ImportError:
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
+    def _json_loads(data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+    _JSONDecodeError = json.JSONDecodeError
+
 # Define default URLs
 DEFAULT_URLS = {
     "openai": "https://api.openai.com/v1",
@@ -18,12 +88,144 @@ DEFAULT_MODELS = {
     "gemini": "gemini-pro-vision", # Use vision model for image support
 }
 
+# Delimiter scheme for multi-chunk batched prompts (see Llm.run_chunks)
+_CHUNK_DELIM_RE = re.compile(r"<<<CHUNK (\d+)>>>\n(.*?)(?=<<<CHUNK \d+>>>|\Z)", re.DOTALL)
+_BATCH_INSTRUCTION = (
+    "The input contains multiple independent segments, each introduced by a "
+    "line of the form <<<CHUNK n>>>. Process every segment separately and "
+    "repeat the exact same <<<CHUNK n>>> delimiter line before each "
+    "segment's output."
+)
+
+# Gemini finish reasons that indicate the response was blocked
+_GEMINI_BLOCK_REASONS = frozenset({"SAFETY", "OTHER", "RECITATION", "BLOCKLIST"})
+
+
+def _extract_openai(data: Dict[str, Any]):
+    """
+    Pulls (error, text) out of an OpenAI chat-completions response dict.
+    Returns None if the expected structure is absent (caller raises).
+    """
+    choices = data.get('choices')
+    if not choices:
+        return None
+    choice = choices[0]
+    message = choice.get('message')
+    if message is not None and 'content' in message:
+        # Content can be a string or a list of parts (for vision)
+        content = message['content']
+        if isinstance(content, list):
+            # If it's a list (e.g., vision response), concatenate text parts
+            return None, "".join([part.get('text', '') for part in content if part.get('type') == 'text'])
+        elif isinstance(content, str):
+            return None, content
+        raise ValueError(f"Unexpected content type in OpenAI response: {type(content)}")
+    if 'text' in choice: # Handle older completions API format if necessary
+        return None, choice['text']
+    return None
+
+
+def _extract_gemini(data: Dict[str, Any]):
+    """
+    Pulls (error, text) out of a Gemini generateContent response dict.
+    Returns None if the expected structure is absent (caller raises).
+    """
+    if 'promptFeedback' in data:
+        try:
+            data['promptFeedback']['blockReason']
+            return 'TOKEN_EXCEEDED', None
+        except Exception as e:
+            raise ValueError(f"Failed to extract block reasons from Gemini response: {e}")
+
+    # Gemini format: data['candidates'][0]['content']['parts'][0]['text']
+    candidate = (data.get('candidates') or [None])[0]
+    if candidate is None:
+        return None
+
+    parts = (candidate.get('content') or {}).get('parts') or []
+    if parts:
+        # Concatenate text from all parts if multiple exist
+        # Note: Gemini can return image parts, but we only extract text here
+        return None, "".join([part['text'] for part in parts if 'text' in part])
+
+    # No content parts: finishReason / safetyRatings explain why
+    finish_reason = candidate.get('finishReason')
+    if finish_reason in _GEMINI_BLOCK_REASONS:
+        raise ValueError(f"Gemini response blocked by finish reason: {finish_reason}. Safety ratings: {candidate.get('safetyRatings', 'N/A')}")
+    if finish_reason is not None:
+        # 'STOP' / 'MAX_TOKENS' are not errors, but with no parts it's still unexpected
+        raise ValueError(f"Gemini response finished with reason: {finish_reason}, but no content parts found.")
+    if 'safetyRatings' in candidate:
+        print(f"Gemini response has safety ratings: {candidate['safetyRatings']}")
+        raise ValueError("Gemini response likely blocked due to safety concerns (no text extracted).")
+    return None
+
+
+def _sniff_mime(buf: bytes) -> str:
+    """
+    Detects an image's MIME type from its magic bytes (first 12 are enough).
+    Defaults to JPEG, the historical assumption, when the format is unknown.
+    """
+    if buf.startswith(b'\xff\xd8\xff'):
+        return "image/jpeg"
+    if buf.startswith(b'\x89PNG'):
+        return "image/png"
+    if buf[:4] == b'RIFF' and buf[8:12] == b'WEBP':
+        return "image/webp"
+    if buf.startswith(b'GIF8'):
+        return "image/gif"
+    return "image/jpeg"
+
+
+# Stream images in 57 KB chunks: a multiple of 3, so each chunk's base64
+# encoding ends on a group boundary and the pieces concatenate cleanly.
+_B64_CHUNK_SIZE = 57 * 1024
+
+
+@functools.lru_cache(maxsize=8)
+def _encode_image_file_cached(path: str, mtime_ns: int, size: int) -> str:
+    """
+    Streams a file into base64 without holding the raw bytes in memory at once.
+
+    Cached on (path, mtime, size) so repeated sends of the same unchanged
+    image (e.g. chunk retries) skip the disk read and encode entirely.
+    """
+    b64 = _load_b64()
+    chunks = []
+    with open(path, 'rb', buffering=0) as f:
+        while buf := f.read(_B64_CHUNK_SIZE):
+            chunks.append(b64.b64encode(buf))
+    return b''.join(chunks).decode('ascii')
+
+
+class _HttpResponse:
+    """
+    Minimal response wrapper mimicking the parts of requests.Response that
+    extract_response needs (ok, status_code, text, json). Used by the async
+    path so aiohttp responses can share the same extraction logic.
+    """
+    def __init__(self, status_code: int, content: bytes):
+        self.status_code = status_code
+        self.content = content
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self) -> Any:
+        return _json_loads(self.content)
+
+
 class Llm:
     """
     A utility class to interact with different LLM providers (OpenAI, Gemini, etc.).
     Handles payload preparation, API calling, and response extraction.
     """
-    def __init__(self, provider: str = "gemini", url: Optional[str] = None, token: Optional[str] = None, model: Optional[str] = None):
+    def __init__(self, provider: str = "gemini", url: Optional[str] = None, token: Optional[str] = None, model: Optional[str] = None, warmup: bool = True, cache: bool = False):
         """
         Initializes the Llm client.
 
@@ -31,31 +233,150 @@ class Llm:
             provider (str): The LLM provider ('openai' or 'gemini'). Defaults to 'gemini'.
             url (Optional[str]): The API endpoint URL. If None, uses the default URL
                                  for the specified provider.
+            warmup (bool): Pre-establish the TLS connection in a background
+                           thread so the first real request skips the handshake.
+                           Disable in unit tests.
+            cache (bool): Memoize identical text requests on disk so repeated
+                          prompts (retries, re-runs) skip the API call.
         """
         supported_providers = list(DEFAULT_URLS.keys())
         if provider.lower() not in supported_providers:
             raise ValueError(f"Unsupported provider: {provider}. Supported providers are: {supported_providers}")
 
         self.provider = provider.lower()
-        self.url = url if url is not None or url == '' else DEFAULT_URLS[self.provider]
+
+        # Response extraction is provider-specific; bind the helper once here
+        # so extract_response is a single dispatch instead of branching per call
+        self._extract = {"openai": _extract_openai, "gemini": _extract_gemini}[self.provider]
 
         # Note: API keys are typically handled via environment variables
         # or passed securely. For this example, we'll look for env vars.
-        self._api_key = token # This is the token for the LLM, not the API key
-        if token is None or token == '':
-            self._api_key = os.environ.get(f"{self.provider.upper()}_API_KEY")
-            if not self._api_key and self.provider in ["openai", "gemini"]:
-                print(f"Warning: {self.provider.upper()}_API_KEY environment variable not found. API calls may fail.")
+        # Both url and token may be lists (or comma-separated strings): each
+        # request round-robins across the (url, key) pairs, multiplying the
+        # effective per-key rate limit by the number of keys.
+        urls = self._as_list(url) or [DEFAULT_URLS[self.provider]]
+        tokens = self._as_list(token)
+        if not tokens:
+            env_key = os.environ.get(f"{self.provider.upper()}_API_KEY")
+            tokens = self._as_list(env_key)
+            if not tokens:
+                if self.provider in ["openai", "gemini"]:
+                    print(f"Warning: {self.provider.upper()}_API_KEY environment variable not found. API calls may fail.")
+                tokens = [None]
+
+        self._endpoints = [
+            (urls[i % len(urls)], tokens[i % len(tokens)])
+            for i in range(max(len(urls), len(tokens)))
+        ]
+        self._rr = itertools.cycle(self._endpoints)
+        self._rr_lock = threading.Lock()
+        # Endpoints that recently returned 429 are skipped until this deadline
+        self._cooldown_until: Dict[tuple, float] = {}
+
+        self.url = urls[0]
+        self._api_key = self._endpoints[0][1] # Primary key, kept for compatibility
+
+        # Pooled session for the sync path: keep-alive reuses one TCP+TLS
+        # connection across calls instead of paying a handshake per request.
+        _load_requests()
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        # Prefer an HTTP/2-capable httpx client when available; concurrent
+        # requests then share one multiplexed TLS connection.
+        self._client = None
+        if httpx is not None:
+            limits = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=75)
+            timeout = httpx.Timeout(connect=10, read=120, write=30, pool=10)
+            try:
+                self._client = httpx.Client(http2=True, limits=limits, timeout=timeout)
+            except ImportError:
+                # The h2 extra is not installed; HTTP/1.1 keep-alive still helps
+                self._client = httpx.Client(limits=limits, timeout=timeout)
+
+        # Session for the async path; created lazily inside a running event loop
+        self._async_session = None
+
+        # Optional exact-match response cache (see utils/cache.py)
+        self._cache = LlmCache() if cache else None
+
+        # Async-path throttling: stay just under the provider's QPM ceiling
+        # and cap in-flight requests. Built lazily inside the event loop.
+        self._qpm = float(os.environ.get("LLM_QPM", "500"))
+        self._max_inflight = int(os.environ.get("LLM_MAX_INFLIGHT", "16"))
+        self._bucket = None
+        self._inflight_sem = None
 
         # Store the default model for the provider, can be overridden in run/prepare_payload
         self._default_model = model
         if model is None or model == '':
             self._default_model = DEFAULT_MODELS.get(self.provider, "unknown")
         
+        # Precompute the per-provider URL template once; call time only
+        # substitutes base/model/key. self.url itself stays key-free so it is
+        # safe to log and the warmup HEAD does not carry the secret.
         if self.provider == 'openai':
+            self._url_template = "{base}/chat/completions"
             self.url = f"{self.url}/chat/completions" # OpenAI chat completions endpoint
         elif self.provider == 'gemini':
-            self.url = f"{self.url}/v1beta/models/{self._default_model}:generateContent?key={token}"
+            self._url_template = "{base}/v1beta/models/{model}:generateContent?key={key}"
+            self.url = f"{self.url}/v1beta/models/{self._default_model}:generateContent"
+
+        # Hide the first-request TLS handshake behind a background thread;
+        # the warmed connection lands in the session pool and is reused.
+        if warmup:
+            threading.Thread(target=self._warm_connection, daemon=True).start()
+
+    def _warm_connection(self):
+        """Best-effort HEAD request to establish the keep-alive connection."""
+        try:
+            warm_url = self.url.split('?')[0]
+            if self._client is not None:
+                self._client.head(warm_url)
+            else:
+                self._session.head(warm_url, timeout=5)
+        except Exception:
+            pass # The real request will connect normally if warmup fails
+
+    @staticmethod
+    def _as_list(value: Optional[Union[str, List[str]]]) -> List[str]:
+        """Normalizes None / 'a,b,c' / ['a', 'b'] into a list of strings."""
+        if value is None or value == '':
+            return []
+        if isinstance(value, str):
+            return [v.strip() for v in value.split(',') if v.strip()]
+        return list(value)
+
+    # Seconds an endpoint sits out of the rotation after returning 429
+    _RATE_LIMIT_COOLDOWN = 30.0
+
+    def _next_endpoint(self) -> tuple:
+        """
+        Returns the next (base_url, api_key) pair in the round-robin cycle,
+        skipping endpoints that are cooling down after a recent 429.
+        """
+        with self._rr_lock:
+            now = time.monotonic()
+            endpoint = next(self._rr)
+            for _ in range(len(self._endpoints) - 1):
+                if self._cooldown_until.get(endpoint, 0.0) <= now:
+                    break
+                endpoint = next(self._rr)
+            # If every endpoint is cooling down, use the last one anyway
+            return endpoint
+
+    def _mark_rate_limited(self, base_url: str, api_key: Optional[str]):
+        """Takes an endpoint out of the rotation for a cooldown window."""
+        with self._rr_lock:
+            self._cooldown_until[(base_url, api_key)] = time.monotonic() + self._RATE_LIMIT_COOLDOWN
 
     def prepare_payload(
         self,
@@ -77,7 +398,10 @@ class Llm:
             **kwargs: Additional parameters for the API call (e.g., temperature, model).
 
         Returns:
-            Dict[str, Any]: The prepared payload dictionary.
+            tuple: (payload, model) — the prepared payload dictionary and the
+                   model to use for the call. The model is returned rather than
+                   stored on self so concurrent run()/arun() calls on one
+                   instance cannot clobber each other's model.
         """
         payload: Dict[str, Any] = {}
         # Get model from kwargs, default to the instance's default model
@@ -90,18 +414,23 @@ class Llm:
             if sysprompt:
                 messages.append({"role": "system", "content": sysprompt})
 
-            # OpenAI Vision requires content to be a list of text and image parts
-            user_content: List[Dict[str, Any]] = []
-            if userprompt:
-                user_content.append({"type": "text", "text": userprompt})
+            if image is None:
+                # Fast path for the common text-only case: plain string content,
+                # no intermediate part-list allocations
+                if userprompt:
+                    messages.append({"role": "user", "content": userprompt})
+            else:
+                # OpenAI Vision requires content to be a list of text and image parts
+                user_content: List[Dict[str, Any]] = []
+                if userprompt:
+                    user_content.append({"type": "text", "text": userprompt})
 
-            if image:
                 try:
-                    image_data_base64 = self._encode_image(image)
+                    mime_type, image_data_base64 = self._encode_image(image)
                     user_content.append({
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_data_base64}"
+                            "url": f"data:{mime_type};base64,{image_data_base64}"
                             # Can add 'detail': 'low'/'high'/'auto' here if needed
                         }
                     })
@@ -111,8 +440,8 @@ class Llm:
                     # For now, we'll print warning and proceed without image part
                     pass # Or raise ValueError(f"Failed to process image: {e}")
 
-            if user_content:
-                 messages.append({"role": "user", "content": user_content if len(user_content) > 1 else user_content[0]['text']}) # If only text, keep it simple string
+                if user_content:
+                     messages.append({"role": "user", "content": user_content if len(user_content) > 1 else user_content[0]['text']}) # If only text, keep it simple string
 
             if assistprompt:
                 # OpenAI expects alternating user/assistant roles for conversation history
@@ -141,27 +470,30 @@ class Llm:
             if userprompt:
                 full_user_prompt += userprompt
 
-            user_parts: List[Dict[str, Any]] = []
-            if full_user_prompt:
-                 user_parts.append({"text": full_user_prompt})
+            if image is None:
+                # Fast path for the common text-only case: one part, built inline
+                if full_user_prompt:
+                    contents.append({"role": "user", "parts": [{"text": full_user_prompt}]})
+            else:
+                user_parts: List[Dict[str, Any]] = []
+                if full_user_prompt:
+                     user_parts.append({"text": full_user_prompt})
 
-            if image:
-                 try:
-                     image_data_base64 = self._encode_image(image)
-                     # Gemini expects image data directly in a 'inline_data' part
-                     user_parts.append({
-                         "inline_data": {
-                             "mime_type": "image/jpeg", # Assume JPEG, could add detection
-                             "data": image_data_base64
-                         }
-                     })
-                 except Exception as e:
-                     print(f"Warning: Could not encode image for Gemini: {e}")
-                     pass # Or raise ValueError(f"Failed to process image: {e}")
-
-
-            if user_parts:
-                 contents.append({"role": "user", "parts": user_parts})
+                try:
+                    mime_type, image_data_base64 = self._encode_image(image)
+                    # Gemini expects image data directly in a 'inline_data' part
+                    user_parts.append({
+                        "inline_data": {
+                            "mime_type": mime_type, # Sniffed from the image's magic bytes
+                            "data": image_data_base64
+                        }
+                    })
+                except Exception as e:
+                    print(f"Warning: Could not encode image for Gemini: {e}")
+                    pass # Or raise ValueError(f"Failed to process image: {e}")
+
+                if user_parts:
+                     contents.append({"role": "user", "parts": user_parts})
 
             if assistprompt:
                 # Gemini uses 'model' role for assistant
@@ -175,25 +507,23 @@ class Llm:
                 # Example: kwargs.get('temperature') could go into generationConfig
                 **kwargs
             }
-            # Store the requested model for call_api to use in the URL
-            self._requested_model = model
 
         else:
             # This case should ideally not be reached due to the check in __init__
             raise NotImplementedError(f"Payload preparation not implemented for provider: {self.provider}")
 
-        return payload
+        return payload, model
 
-    def _encode_image(self, image: Union[str, bytes]) -> str:
+    def _encode_image(self, image: Union[str, bytes]) -> tuple:
         """
-        Encodes an image (path or bytes) to a base64 string.
-        Assumes JPEG format for base64 encoding type.
+        Encodes an image (path or bytes) to base64, sniffing its MIME type.
 
         Args:
             image (Union[str, bytes]): Path to an image file (str) or image data (bytes).
 
         Returns:
-            str: The base64 encoded image data.
+            tuple: (mime_type, base64_data) — MIME type detected from the
+                   image's magic bytes (JPEG assumed if unknown).
 
         Raises:
             FileNotFoundError: If the image path does not exist.
@@ -204,90 +534,188 @@ class Llm:
             if not os.path.exists(image):
                 raise FileNotFoundError(f"Image file not found: {image}")
             try:
-                with open(image, "rb") as image_file:
-                    return base64.b64encode(image_file.read()).decode('utf-8')
+                with open(image, 'rb') as f:
+                    mime_type = _sniff_mime(f.read(16))
+                stat = os.stat(image)
+                # Key on (path, mtime, size) so retries of a failed chunk don't
+                # re-read and re-encode the same unchanged file.
+                return mime_type, _encode_image_file_cached(image, stat.st_mtime_ns, stat.st_size)
             except IOError as e:
                 raise IOError(f"Error reading image file {image}: {e}")
         elif isinstance(image, bytes):
-            return base64.b64encode(image).decode('utf-8')
+            # memoryview avoids copying the caller's buffer before encoding
+            return _sniff_mime(image[:16]), _load_b64().b64encode(memoryview(image)).decode('ascii')
         else:
             raise TypeError("Image must be a file path (str) or bytes.")
 
 
-    def call_api(self, payload: Dict[str, Any]) -> requests.Response:
+    def _build_request(self, payload: Dict[str, Any], model: Optional[str] = None) -> tuple:
         """
-        Makes the API call to the configured URL.
+        Builds the request URL, headers and serialized body for a payload.
+
+        Shared by the sync (call_api) and async (_acall_api) paths so the
+        provider-specific URL/header logic lives in one place.
 
         Args:
             payload (Dict[str, Any]): The prepared request payload.
 
         Returns:
-            requests.Response: The response object from the API call.
+            tuple: (request_url, headers, body, endpoint) where body is the
+                   JSON-encoded payload and endpoint is the (base_url, api_key)
+                   pair chosen by the round-robin, for cooldown bookkeeping.
 
         Raises:
-            requests.exceptions.RequestException: If the API call fails.
             ValueError: If API key is missing for providers requiring it.
         """
         headers = {
             "Content-Type": "application/json",
         }
-        request_url = self.url # Start with the base URL from init
+        base_url, api_key = self._next_endpoint()
 
         if self.provider == "openai":
-            if not self._api_key:
+            if not api_key:
                  raise ValueError("OpenAI API key not found. Set OPENAI_API_KEY environment variable.")
-            headers["Authorization"] = f"Bearer {self._api_key}"
+            headers["Authorization"] = f"Bearer {api_key}"
             # OpenAI model is in the payload body
+            request_url = self._url_template.format(base=base_url)
 
         elif self.provider == "gemini":
-            if not self._api_key:
+            if not api_key:
                  raise ValueError("Gemini API key not found. Set GEMINI_API_KEY environment variable.")
-            # Gemini API key is typically passed as a query parameter
-            # If a specific model was requested via kwargs in prepare_payload, update the URL path
-            gemini_model_in_url = self._default_model # Start with default
-            if hasattr(self, '_requested_model'):
-                gemini_model_in_url = self._requested_model
-
-                # Construct the correct Gemini URL with the model and endpoint
-                # Example: https://generativelanguage.googleapis.com/v1beta/models/gemini-pro-vision:generateContent
-                # base_url_parts = DEFAULT_URLS["gemini"].split('/')
-                base_url_parts = self.url.split('/')
-                # Find the index of 'models' and replace the part after it
-                try:
-                    models_index = base_url_parts.index('models')
-                    # Reconstruct the URL with the correct model and endpoint (:generateContent)
-                    request_url = '/'.join(base_url_parts[:models_index + 1] + [f"{gemini_model_in_url}:generateContent?key={self._api_key}"])
-                except ValueError:
-                    # Fallback if 'models' isn't in the default URL structure (shouldn't happen with current defaults)
-                    print(f"Warning: 'models' not found in default Gemini URL structure. Using base URL: {self.url}")
-                    request_url = self.url # Use the URL from init as fallback
-
-                # request_url = f"{request_url}?key={self._api_key}"
-                request_url = request_url
-            else:
-                request_url = self.url
-
+            # Gemini takes the model in the URL path and the key as a query parameter
+            request_url = self._url_template.format(base=base_url, model=model or self._default_model, key=api_key)
 
         else:
              raise NotImplementedError(f"API call not implemented for provider: {self.provider}")
 
+        return request_url, headers, _json_dumps(payload), (base_url, api_key)
+
+
+    def call_api(self, payload: Dict[str, Any], model: Optional[str] = None) -> "requests.Response":
+        """
+        Makes the API call to the configured URL.
+
+        Args:
+            payload (Dict[str, Any]): The prepared request payload.
+            model (Optional[str]): Model for the request URL (Gemini); defaults
+                                   to the instance's default model.
+
+        Returns:
+            requests.Response: The response object from the API call.
 
+        Raises:
+            requests.exceptions.RequestException: If the API call fails.
+            ValueError: If API key is missing for providers requiring it.
+        """
+        request_url, headers, body, endpoint = self._build_request(payload, model)
+
+        http_errors = (requests.exceptions.RequestException,) if httpx is None else (requests.exceptions.RequestException, httpx.HTTPError)
         try:
-            response = requests.post(request_url, headers=headers, data=json.dumps(payload))
+            if self._client is not None:
+                r = self._client.post(request_url, headers=headers, content=body)
+                r.raise_for_status() # Raise an HTTPStatusError for bad responses (4xx or 5xx)
+                return _HttpResponse(r.status_code, r.content)
+            response = self._session.post(request_url, headers=headers, data=body, timeout=(10, 120))
             response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
             return response
-        except requests.exceptions.RequestException as e:
-            print(f"API call failed for {self.provider} at {request_url}: {e}")
+        except http_errors as e:
+            if getattr(getattr(e, 'response', None), 'status_code', None) == 429:
+                self._mark_rate_limited(*endpoint)
+            # Strip the query string before logging: for Gemini it carries the API key
+            print(f"API call failed for {self.provider} at {request_url.split('?')[0]}: {e}")
             # Attempt to print response body if available for debugging
             if hasattr(e, 'response') and e.response is not None:
                  try:
                      print(f"Response body: {e.response.text}")
                  except Exception:
                      pass # Ignore if response body can't be printed
-            raise # Re-raise the exception after printing info
+            raise # Re-raise the exception
+
+
+    def close(self):
+        """Releases the pooled HTTP connections held by the sync transports."""
+        if self._client is not None:
+            self._client.close()
+        self._session.close()
 
+    def __enter__(self):
+        return self
 
-    def extract_response(self, api_response: requests.Response) -> str:
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    async def _aensure_session(self):
+        """
+        Lazily creates the shared aiohttp session used by the async path.
+
+        Created on first use (must happen inside a running event loop) with a
+        pooled keep-alive connector so concurrent requests reuse connections.
+        """
+        import aiohttp # Imported lazily so the sync path works without aiohttp installed
+
+        if self._async_session is None or self._async_session.closed:
+            self._async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, limit_per_host=32, keepalive_timeout=75)
+            )
+        return self._async_session
+
+    async def aclose(self):
+        """Closes the aiohttp session if one was created."""
+        if self._async_session is not None and not self._async_session.closed:
+            await self._async_session.close()
+        self._async_session = None
+
+    async def _acall_api(self, payload: Dict[str, Any], model: Optional[str] = None) -> _HttpResponse:
+        """
+        Async counterpart of call_api using the shared aiohttp session.
+
+        Args:
+            payload (Dict[str, Any]): The prepared request payload.
+
+        Returns:
+            _HttpResponse: A lightweight response wrapper for extract_response.
+
+        Raises:
+            aiohttp.ClientError: If the API call fails.
+            ValueError: If API key is missing for providers requiring it.
+        """
+        import aiohttp
+
+        session = await self._aensure_session()
+
+        if self._bucket is None:
+            self._bucket = AsyncTokenBucket(rate_per_sec=self._qpm / 60.0, burst=self._max_inflight)
+            self._inflight_sem = asyncio.Semaphore(self._max_inflight)
+
+        max_attempts = 5
+        for attempt in range(max_attempts):
+            # Rebuilt per attempt so retries rotate to the next endpoint
+            request_url, headers, body, endpoint = self._build_request(payload, model)
+            async with self._inflight_sem:
+                await self._bucket.acquire()
+                try:
+                    async with session.post(request_url, headers=headers, data=body) as response:
+                        content = await response.read()
+                        if response.status != 429:
+                            response.raise_for_status()
+                            return _HttpResponse(response.status, content)
+                        self._mark_rate_limited(*endpoint)
+                except aiohttp.ClientError as e:
+                    # Query string stripped from the log: for Gemini it carries the API key
+                    print(f"API call failed for {self.provider} at {request_url.split('?')[0]}: {e}")
+                    raise # Re-raise the exception
+
+            # 429 / RESOURCE_EXHAUSTED: back off with jitter, then retry
+            if attempt < max_attempts - 1:
+                delay = random.uniform(0.5, 2.0) * 2 ** attempt
+                print(f"Rate limited by {self.provider} (429). Retrying in {delay:.1f}s (attempt {attempt + 1}/{max_attempts}).")
+                await asyncio.sleep(delay)
+
+        # Still rate limited after all attempts; hand the 429 to extract_response
+        return _HttpResponse(429, content)
+
+
+    def extract_response(self, api_response: "requests.Response") -> str:
         """
         Extracts the text content from the API response.
 
@@ -306,65 +734,22 @@ class Llm:
             return api_response.status_code, None # Return the raw response text if not OK
 
         try:
-            response_data = api_response.json()
-        except json.JSONDecodeError:
+            response_data = _json_loads(api_response.content)
+        except _JSONDecodeError:
             raise ValueError(f"Failed to decode JSON response from {self.provider}: {api_response.text}")
 
-        if self.provider == "openai":
-            # OpenAI format: response_data['choices'][0]['message']['content']
-            if 'choices' in response_data and len(response_data['choices']) > 0:
-                choice = response_data['choices'][0]
-                if 'message' in choice and 'content' in choice['message']:
-                    # Content can be a string or a list of parts (for vision)
-                    content = choice['message']['content']
-                    if isinstance(content, list):
-                        # If it's a list (e.g., vision response), concatenate text parts
-                        return None, "".join(part.get('text', '') for part in content if part.get('type') == 'text')
-                    elif isinstance(content, str):
-                        return None, content
-                    else:
-                         raise ValueError(f"Unexpected content type in OpenAI response: {type(content)}")
-                elif 'text' in choice: # Handle older completions API format if necessary
-                     return None, choice['text']
+        result = self._extract(response_data)
+        if result is None:
+            # The expected structure was not found or no text was extractable
+            raise ValueError(f"Could not extract text from {self.provider} response. Unexpected format or missing text content: {response_data}")
+        return result
 
-        elif self.provider == "gemini":
-            if 'promptFeedback' in response_data:
-                try:
-                    block_reason = response_data['promptFeedback']['blockReason']
-                    return 'TOKEN_EXCEEDED', None
-                except Exception as e:
-                    raise ValueError(f"Failed to extract block reasons from Gemini response: {e}")
-
-            # Gemini format: response_data['candidates'][0]['content']['parts'][0]['text']
-            if 'candidates' in response_data and len(response_data['candidates']) > 0:
-                candidate = response_data['candidates'][0]
-                if 'content' in candidate and 'parts' in candidate['content'] and len(candidate['content']['parts']) > 0:
-                    # Concatenate text from all parts if multiple exist
-                    # Note: Gemini can return image parts, but we only extract text here
-                    return None, "".join(part.get('text', '') for part in candidate['content']['parts'] if 'text' in part)
-                # Handle potential 'finishReason' or 'safetyRatings' indicating no text response
-                if 'finishReason' in candidate:
-                     # Check if finishReason indicates a block
-                     block_reasons = ["SAFETY", "OTHER"] # Add other block reasons if known
-                     if candidate['finishReason'] in block_reasons:
-                          safety_ratings = candidate.get('safetyRatings', 'N/A')
-                          raise ValueError(f"Gemini response blocked by finish reason: {candidate['finishReason']}. Safety ratings: {safety_ratings}")
-                     # Otherwise, it might be 'STOP' or 'MAX_TOKENS', which are not errors
-                     # If there's no text content despite a non-error finish reason, it's still unexpected
-                     if not candidate['content']['parts']:
-                          raise ValueError(f"Gemini response finished with reason: {candidate['finishReason']}, but no content parts found.")
-                     # If there are parts but no text, the loop above handles it by returning ""
-
-                if 'safetyRatings' in candidate:
-                     # Optionally log safety issues even if not fully blocked
-                     print(f"Gemini response has safety ratings: {candidate['safetyRatings']}")
-                     # If no text was extracted, and safety ratings are present, it might be the cause
-                     if not candidate['content']['parts'] or not any('text' in part for part in candidate['content']['parts']):
-                          raise ValueError("Gemini response likely blocked due to safety concerns (no text extracted).")
-
-
-        # If we reach here, the expected structure was not found or no text was extractable
-        raise ValueError(f"Could not extract text from {self.provider} response. Unexpected format or missing text content: {response_data}")
+    def _cache_key(self, sysprompt, userprompt, assistprompt, image, kwargs) -> Optional[str]:
+        """Returns the response-cache key for a request, or None if not cacheable."""
+        if self._cache is None or image is not None:
+            return None # Image requests are not cached (key would need the image bytes)
+        model = kwargs.get("model", self._default_model)
+        return LlmCache.make_key(model, sysprompt, userprompt, assistprompt)
 
     def run(
         self,
@@ -392,11 +777,15 @@ class Llm:
             Exception: Propagates exceptions from prepare_payload, call_api, or extract_response.
         """
         
-        from .common import format_dict_for_debug
+        cache_key = self._cache_key(sysprompt, userprompt, assistprompt, image, kwargs)
+        if cache_key is not None:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return cached
 
         try:
             # Pass all relevant arguments to prepare_payload
-            payload = self.prepare_payload(
+            payload, model = self.prepare_payload(
                 sysprompt=sysprompt,
                 userprompt=userprompt,
                 assistprompt=assistprompt,
@@ -405,13 +794,174 @@ class Llm:
             )
             # print(f"payload: {format_dict_for_debug(payload, 200, 100, 100)}")
             # print(f"payload: {payload}")
-            api_response = self.call_api(payload)
+            api_response = self.call_api(payload, model)
+            error, extracted_text = self.extract_response(api_response)
+            if cache_key is not None and error is None:
+                self._cache.put(cache_key, error, extracted_text)
+            return error, extracted_text
+        except Exception as e:
+            print(f"An error occurred during the LLM run: {e}")
+            raise # Re-raise the exception
+
+    async def arun(
+        self,
+        userprompt: Optional[str] = None,
+        sysprompt: Optional[str] = None,
+        assistprompt: Optional[str] = None,
+        image: Optional[Union[str, bytes]] = None,
+        **kwargs: Any
+    ):
+        """
+        Async counterpart of run: prepare payload, call API, extract response.
+
+        Args:
+            userprompt (Optional[str]): The main user input prompt.
+            sysprompt (Optional[str]): The system prompt/instructions.
+            assistprompt (Optional[str]): Previous assistant response(s) for context.
+            image (Optional[Union[str, bytes]]): Path to an image file (str) or image data (bytes).
+            **kwargs: Additional parameters for the API call.
+
+        Returns:
+            tuple: (error, extracted_text) as returned by extract_response.
+        """
+        cache_key = self._cache_key(sysprompt, userprompt, assistprompt, image, kwargs)
+        if cache_key is not None:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        try:
+            payload, model = self.prepare_payload(
+                sysprompt=sysprompt,
+                userprompt=userprompt,
+                assistprompt=assistprompt,
+                image=image,
+                **kwargs
+            )
+            api_response = await self._acall_api(payload, model)
             error, extracted_text = self.extract_response(api_response)
+            if cache_key is not None and error is None:
+                self._cache.put(cache_key, error, extracted_text)
             return error, extracted_text
         except Exception as e:
             print(f"An error occurred during the LLM run: {e}")
             raise # Re-raise the exception
 
+    async def arun_many(
+        self,
+        prompts: List[str],
+        sysprompt: Optional[str] = None,
+        max_concurrency: int = 16,
+        **kwargs: Any
+    ) -> List[tuple]:
+        """
+        Runs many user prompts concurrently, bounded by a semaphore.
+
+        Instead of paying one network round-trip per prompt serially, all
+        prompts are in flight at once (up to max_concurrency), so a batch
+        completes in roughly the time of the slowest single call.
+
+        Args:
+            prompts (List[str]): The user prompts to run.
+            sysprompt (Optional[str]): System prompt shared by every request.
+            max_concurrency (int): Maximum number of in-flight requests.
+            **kwargs: Additional parameters passed through to arun.
+
+        Returns:
+            List[tuple]: (error, extracted_text) tuples in prompt order.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(prompt: str):
+            async with semaphore:
+                return await self.arun(userprompt=prompt, sysprompt=sysprompt, **kwargs)
+
+        try:
+            return await asyncio.gather(*(run_one(p) for p in prompts))
+        finally:
+            # Close the session inside the loop so asyncio.run() callers don't leak it
+            await self.aclose()
+
+    def run_many(
+        self,
+        prompts: List[str],
+        sysprompt: Optional[str] = None,
+        max_concurrency: int = 16,
+        **kwargs: Any
+    ) -> List[tuple]:
+        """
+        Synchronous convenience wrapper around arun_many for non-async callers.
+        """
+        return asyncio.run(self.arun_many(prompts, sysprompt=sysprompt, max_concurrency=max_concurrency, **kwargs))
+
+    def run_chunks(
+        self,
+        chunks: List[str],
+        sysprompt: Optional[str] = None,
+        max_chars: int = 12000,
+        **kwargs: Any
+    ) -> List[Optional[str]]:
+        """
+        Processes many short chunks in as few API requests as possible.
+
+        Chunks are greedily grouped up to max_chars characters, each group is
+        sent as one prompt with indexed <<<CHUNK n>>> delimiters (the system
+        prompt instructs the model to repeat them), and the response is split
+        back into per-chunk results. Any chunk that cannot be recovered from
+        the batched response falls back to an individual run() call, so
+        correctness never depends on the model honoring the delimiters.
+
+        Args:
+            chunks (List[str]): The chunks to process.
+            sysprompt (Optional[str]): System prompt applied to every chunk.
+            max_chars (int): Character budget per batched request.
+            **kwargs: Additional parameters passed through to run.
+
+        Returns:
+            List[Optional[str]]: Per-chunk results in input order; None where
+                                 processing failed.
+        """
+        results: List[Optional[str]] = [None] * len(chunks)
+        batch_sysprompt = f"{sysprompt}\n\n{_BATCH_INSTRUCTION}" if sysprompt else _BATCH_INSTRUCTION
+
+        # Greedily pack chunk indices into groups under the character budget
+        groups: List[List[int]] = []
+        current: List[int] = []
+        current_len = 0
+        for i, chunk in enumerate(chunks):
+            extra = len(chunk) + 16 # 16 ~ delimiter line overhead
+            if current and current_len + extra > max_chars:
+                groups.append(current)
+                current, current_len = [], 0
+            current.append(i)
+            current_len += extra
+        if current:
+            groups.append(current)
+
+        def run_single(i: int):
+            error, text = self.run(userprompt=chunks[i], sysprompt=sysprompt, **kwargs)
+            results[i] = text if error is None else None
+
+        for group in groups:
+            if len(group) == 1:
+                run_single(group[0])
+                continue
+
+            prompt = "\n".join(f"<<<CHUNK {i}>>>\n{chunks[i]}" for i in group)
+            error, text = self.run(userprompt=prompt, sysprompt=batch_sysprompt, **kwargs)
+
+            parsed = {}
+            if error is None and text:
+                parsed = {int(m.group(1)): m.group(2).rstrip('\n') for m in _CHUNK_DELIM_RE.finditer(text)}
+
+            for i in group:
+                if parsed.get(i, "").strip():
+                    results[i] = parsed[i]
+                else:
+                    run_single(i) # Delimiter missing/mangled: retry individually
+
+        return results
+
     # Note on Image Output:
     # Standard text generation APIs like the ones used here (OpenAI Chat, Gemini Pro/Vision)
     # return text responses. If the LLM generates a description of an image,
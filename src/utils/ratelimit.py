@@ -0,0 +1,46 @@
+# src/utils/ratelimit.py
+import asyncio
+import time
+
+
+class AsyncTokenBucket:
+    """
+    Token-bucket rate limiter for asyncio callers.
+
+    Tokens refill continuously at rate_per_sec up to a burst ceiling;
+    acquire() consumes one token, waiting if none is available. Used to keep
+    concurrent LLM requests just below the provider's queries-per-minute
+    limit instead of triggering 429 storms.
+    """
+
+    def __init__(self, rate_per_sec: float, burst: int):
+        """
+        Args:
+            rate_per_sec (float): Sustained token refill rate.
+            burst (int): Maximum tokens that can accumulate (burst size).
+        """
+        self.rate = float(rate_per_sec)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._cond = asyncio.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Waits until one token is available and consumes it."""
+        async with self._cond:
+            while True:
+                self._refill()
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                # Sleep until roughly when the next token lands, then re-check
+                wait = (1.0 - self._tokens) / self.rate
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
@@ -1,9 +1,161 @@
 # src/translate.py
+import asyncio
 import json
+import mmap
 import os
 import sys
 import time
 import math # Import math for ceil/floor if needed for percentage check
+import re
+from collections import deque
+
+# orjson parses straight from bytes (no utf-8 decode pass) several times
+# faster than stdlib json; fall back to stdlib when it is not installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# tiktoken gives real token counts for tiling; without it a crude ~3 chars
+# per token estimate is used, which is close enough for CJK-heavy text.
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Token budget per LLM call for tile_by_tokens; sized so a tile comfortably
+# fits the provider's context window
+MAX_TOKENS_PER_CALL = int(os.environ.get("MAX_TOKENS_PER_CALL", "3000"))
+
+_token_encoder = None
+
+
+def _estimate_tokens(text):
+    """Approximate token count of text (tiktoken if available, else chars/3)."""
+    global _token_encoder
+    if tiktoken is not None:
+        if _token_encoder is None:
+            _token_encoder = tiktoken.get_encoding("cl100k_base")
+        return len(_token_encoder.encode(text))
+    return len(text) // 3 + 1
+
+
+def tile_by_tokens(text, budget=None, hard_breaks=('\n', '。')):
+    """
+    Splits text into consecutive tiles, each close to the token budget.
+
+    A greedy forward scan emits a tile at the last hard-break boundary inside
+    each budget-sized window, so an oversize chapter becomes roughly
+    total/budget calls instead of the 2x-per-level amplification of repeated
+    halving.
+
+    Args:
+        text (str): The text to tile.
+        budget (int): Token budget per tile. Defaults to MAX_TOKENS_PER_CALL.
+        hard_breaks (tuple): Preferred boundary characters, tried in order.
+
+    Returns:
+        list of str: The tiles, in original order.
+    """
+    if budget is None:
+        budget = MAX_TOKENS_PER_CALL
+    if _estimate_tokens(text) <= budget:
+        return [text]
+
+    # Window in characters; ~3 chars per token tracks the estimator above
+    window = max(1, budget * 3)
+    tiles = []
+    pos = 0
+    n = len(text)
+    while pos < n:
+        end = pos + window
+        if end >= n:
+            tiles.append(text[pos:])
+            break
+        cut = -1
+        for brk in hard_breaks:
+            # Strict priority order: a lower-priority break (。) is only
+            # considered when the window holds no newline, so tiling never
+            # invents a line break the caller's "\n".join would keep
+            cut = text.rfind(brk, pos, end)
+            if cut > pos:
+                break
+        if cut <= pos:
+            cut = end - 1  # No boundary inside the window; cut at the budget
+        tile = text[pos:cut + 1]
+        if tile.endswith('\n'):
+            # Same convention as split_content: the newline at the split point
+            # is dropped and restored by the caller's "\n".join
+            tile = tile[:-1]
+        tiles.append(tile)
+        pos = cut + 1
+    return [tile for tile in tiles if tile]
+
+
+def _load_json(json_path):
+    """Parses a JSON file, memory-mapping it to skip the read-buffer copy."""
+    with open(json_path, 'rb') as f:
+        if orjson is None:
+            return json.load(f)
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return orjson.loads(memoryview(mm))
+        except ValueError:
+            # Empty files cannot be mmapped
+            return orjson.loads(f.read())
+
+# Paragraph wrapping as one C-level regex pass instead of a Python-level
+# f-string per line; requiring one \S leaves empty and whitespace-only lines
+# unwrapped, like the old strip() filter.
+_P_WRAP = re.compile(r"[^\n]*\S[^\n]*")
+_P_REPL = r"<p>\g<0></p>"
+
+# UTF-8 encoding of the CJK full stop, for byte-level searching
+_STOP_UTF8 = '。'.encode('utf-8')
+
+# Above this size the numpy newline search pays off; below it the array
+# conversion overhead outweighs the SIMD scan
+_NUMPY_SPLIT_THRESHOLD = 1_000_000
+
+
+def _rfind_newline(encoded, half_length):
+    """
+    Last newline byte offset before half_length, or -1.
+
+    Very large buffers go through numpy's SIMD-accelerated comparison kernel
+    (imported lazily, optional); everything else uses bytes.rfind.
+    """
+    if len(encoded) > _NUMPY_SPLIT_THRESHOLD:
+        try:
+            import numpy as np
+        except ImportError:
+            pass
+        else:
+            newlines = np.flatnonzero(np.frombuffer(encoded, dtype=np.uint8)[:half_length] == 0x0A)
+            return int(newlines[-1]) if newlines.size else -1
+    return encoded.rfind(b'\n', 0, half_length)
+
+# All template placeholders in one alternation, so save_html substitutes them
+# with a single pass over the template instead of one str.replace scan each
+_TEMPLATE_RE = re.compile(
+    r"\{\{book\}\}|\{\{title\}\}|<p></p>\{\{content\}\}|\{\{ '%04d' % \(index \+ 1\) \}\}"
+)
+
+# LLM error strings that mean the request should be split and retried; one
+# compiled alternation scans the response once instead of three `in` checks
+_TOKEN_ERR = re.compile(r"TOKEN_EXCEEDED|HTML error 50[04]")
+
+def _line_count(s):
+    """
+    Number of lines in s, ignoring a leading/trailing newline.
+
+    Pure counting passes - no strip() copy, no split() list - so validating
+    a large chapter allocates nothing.
+    """
+    if not s:
+        return 0
+    return s.count('\n') + 1 - s.startswith('\n') - s.endswith('\n')
+
 
 def split_content(text, max_length=200):
     """
@@ -19,27 +171,33 @@ def split_content(text, max_length=200):
     if len(text) <= max_length:
         return [text]
 
+    # Search on a UTF-8 bytes view: bytes.rfind dispatches to libc memrchr,
+    # which is much faster than the str search paths for CJK-heavy text.
+    # UTF-8 is self-synchronizing, so byte offsets of '\n' and '。' always
+    # fall on character boundaries and the halves decode cleanly.
+    encoded = text.encode('utf-8')
+    half_length = len(encoded) // 2
+
     # 1. Attempt to split by newline
-    if '\n' in text:
+    if b'\n' in encoded:
         # Find the position of the last newline before half of the text
-        half_length = len(text) // 2
-        last_newline = text.rfind('\n', 0, half_length)
+        last_newline = _rfind_newline(encoded, half_length)
         if last_newline != -1:
-            part1 = text[:last_newline]
-            part2 = text[last_newline + 1:]
+            part1 = encoded[:last_newline].decode('utf-8')
+            part2 = encoded[last_newline + 1:].decode('utf-8')
             return [part1, part2]
         else:
             # No newline in the first half, split at max_length
             return [text[:max_length], text[max_length:]]
 
     # 2. If no newline, attempt to split by '。'
-    if '。' in text:
+    if _STOP_UTF8 in encoded:
         # Find the position of the last '。' before half of the text
-        half_length = len(text) // 2
-        last_stop = text.rfind('。', 0, half_length)
+        last_stop = encoded.rfind(_STOP_UTF8, 0, half_length)
         if last_stop != -1:
-            part1 = text[:last_stop + 1]  # Include the '。'
-            part2 = text[last_stop + 1:]
+            split_at = last_stop + len(_STOP_UTF8)  # Include the '。'
+            part1 = encoded[:split_at].decode('utf-8')
+            part2 = encoded[split_at:].decode('utf-8')
             return [part1, part2]
         else:
             # No '。' in the first half, split at max_length
@@ -74,7 +232,17 @@ class Translate:
         self.system_prompt = system_prompt
         self.template_path = 'templates/default.html' # Assuming template is here
 
-        if not os.path.exists(self.template_path):
+        # Read the template once per process; save_html reuses the cached text
+        # instead of re-reading the file for every chapter.
+        # Output directories already created this process; saves one mkdir
+        # syscall per chapter when many chapters of a book are processed
+        self._created_dirs = set()
+
+        self._template_text = None
+        if os.path.exists(self.template_path):
+            with open(self.template_path, 'r', encoding='utf-8') as f:
+                self._template_text = f.read()
+        else:
              print(f"Error: HTML template not found at {self.template_path}", file=sys.stderr)
              # Decide how to handle this - maybe raise an exception or exit
              # For now, we'll let it fail later when saving
@@ -95,11 +263,8 @@ class Translate:
         Returns:
             True if validation passes, False otherwise.
         """
-        original_lines = original_content.strip().split('\n')
-        translated_lines = translated_content.strip().split('\n')
-
-        original_line_count = len(original_lines)
-        translated_line_count = len(translated_lines)
+        original_line_count = _line_count(original_content)
+        translated_line_count = _line_count(translated_content)
 
         # Check line count variance
         line_count_variance_too_high = False
@@ -156,24 +321,23 @@ class Translate:
             or None if the file cannot be read or parsed.
         """
         try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Extract required fields
-                content_data = {
-                    'book': data.get('book'),
-                    'index': data.get('index'),
-                    'title': data.get('title'),
-                    'content': data.get('content')
-                }
-                # Basic check if essential fields are present
-                if not all([content_data['book'], content_data['index'] is not None, content_data['title'], content_data['content']]):
-                     print(f"Error: Missing essential fields in JSON file {json_path}", file=sys.stderr)
-                     return None
-                return content_data
+            data = _load_json(json_path)
+            # Extract required fields
+            content_data = {
+                'book': data.get('book'),
+                'index': data.get('index'),
+                'title': data.get('title'),
+                'content': data.get('content')
+            }
+            # Basic check if essential fields are present
+            if not all([content_data['book'], content_data['index'] is not None, content_data['title'], content_data['content']]):
+                 print(f"Error: Missing essential fields in JSON file {json_path}", file=sys.stderr)
+                 return None
+            return content_data
         except FileNotFoundError:
             print(f"Error: JSON file not found at {json_path}", file=sys.stderr)
             return None
-        except json.JSONDecodeError:
+        except ValueError: # Covers both json and orjson decode errors
             print(f"Error: Could not decode JSON from {json_path}", file=sys.stderr)
             return None
         except Exception as e:
@@ -213,7 +377,7 @@ class Translate:
                     print(f"Warning: Short response ({len(translated_text)} chars) for long input ({len(text_to_translate)} chars). Treating as connection error.", file=sys.stderr)
                     return "CONNECTION_ERROR", None
                 # Check for specific error indicators from LLM
-                if (("TOKEN_EXCEEDED" in html_rtn) or ("HTML error 500" in html_rtn) or ("HTML error 504" in html_rtn)):
+                if _TOKEN_ERR.search(html_rtn):
                     print("Warning: LLM returned HTML error 500/504.", file=sys.stderr)
                     return "TOKEN_EXCEEDED", None
                 return None, translated_text  # Success
@@ -226,48 +390,63 @@ class Translate:
                 else:
                     return "OTHER_ERROR", None  # Indicate a different type of error
 
-        def translate_recursive(text, retries_remaining):
-            """
-            Recursively attempts to translate the text, handling retries and splitting.
-
-            Args:
-                text (str): The text to translate.
-                retries_remaining (int): The number of retries left.
+        def split_for_retry(text):
+            """Token-budgeted tiling, falling back to halving when the
+            estimator thought the text fit but the provider disagreed."""
+            parts = tile_by_tokens(text)
+            if len(parts) == 1:
+                parts = split_content(text)
+            return parts
+
+        # Iterative work queue instead of recursion: pieces are processed
+        # left-to-right so the output order matches the input, splitting only
+        # the pieces that actually hit the token limit. No recursion depth to
+        # worry about on deeply split content, and no duplicate LLM calls on
+        # text we already know is too long.
+        queue = deque([(content, max_retries)])
+        translated_parts = []
+        min_failed_len = None  # Smallest length known to exceed the token limit
+
+        while queue:
+            text, retries_remaining = queue.popleft()
+            if not text.strip():
+                translated_parts.append("")
+                continue
+
+            # Anything at least as long as a known-failing length is pre-split;
+            # calling the LLM on it would just burn a request on TOKEN_EXCEEDED.
+            if min_failed_len is not None and len(text) >= min_failed_len:
+                parts = split_for_retry(text)
+                if len(parts) > 1:
+                    print(f"Pre-splitting {len(text)} chars (token limit known to trip at {min_failed_len}).", file=sys.stderr)
+                    queue.extendleft((part, max_retries) for part in reversed(parts))
+                    continue
 
-            Returns:
-                str or None: The translated text or None if failed.
-            """
             print(f"len(text): {len(text)}, lines: {len(text.splitlines())}", file=sys.stderr)
             error, result = call_llm(text)
             if error == "TOKEN_EXCEEDED":
+                if min_failed_len is None or len(text) < min_failed_len:
+                    min_failed_len = len(text)
+                parts = split_for_retry(text)
+                if len(parts) == 1:
+                    print("Token limit exceeded on minimum-size content. Cannot split further.", file=sys.stderr)
+                    return None
                 print("Token limit exceeded. Splitting content and retrying parts.", file=sys.stderr)
-                parts = split_content(text)
-                translated_parts = []
-                for i, part in enumerate(parts):
-                    if not part.strip():
-                        translated_parts.append("")
-                        continue
-                    translated_part = translate_recursive(part, max_retries)
-                    if translated_part is None:
-                        print(f"Failed to translate part {i+1}/{len(parts)} after retries.", file=sys.stderr)
-                        return None  # Fail the whole translation if any part fails
-                    translated_parts.append(translated_part)
-                return "\n".join(translated_parts)
+                queue.extendleft((part, max_retries) for part in reversed(parts))
             elif error in ["CONNECTION_ERROR", "OTHER_ERROR"]:
                 if retries_remaining > 0:
-                    print(f"Translation failed ({error}). Retrying whole content ({retries_remaining} retries left).", file=sys.stderr)
+                    print(f"Translation failed ({error}). Retrying ({retries_remaining} retries left).", file=sys.stderr)
                     time.sleep(retry_delay)
-                    return translate_recursive(text, retries_remaining - 1)
+                    queue.appendleft((text, retries_remaining - 1))
                 else:
                     print(f"Failed to translate content after {max_retries} retries.", file=sys.stderr)
                     return None  # Translation failed after all retries
             else:
                 if result is None:
                     return None
-                else:
-                    return result  # Initial translation successful
+                translated_parts.append(result)
 
-        return translate_recursive(content, max_retries)
+        return "\n".join(translated_parts)
 
     def save_html(self, book, index, title, content):
         """
@@ -283,7 +462,9 @@ class Translate:
             The path to the saved HTML file on success, None on failure.
         """
         output_dir = os.path.join('.', book) # Output directory is ./book
-        os.makedirs(output_dir, exist_ok=True) # Create directory if it doesn't exist
+        if output_dir not in self._created_dirs:
+            os.makedirs(output_dir, exist_ok=True) # Create directory if it doesn't exist
+            self._created_dirs.add(output_dir)
 
         # Format index as 4 digits
         formatted_index = f"{index:04d}"
@@ -291,28 +472,26 @@ class Translate:
         output_path = os.path.join(output_dir, output_filename)
 
         try:
-            with open(self.template_path, 'r', encoding='utf-8') as f:
-                template_content = f.read()
-
-            # Replace placeholders in the template
-            # Basic string replacement - consider Jinja2 for more complex templates
-            html_content = template_content.replace('{{book}}', str(book))
-            html_content = html_content.replace('{{title}}', str(title))
-            # Replace <p></p>{{content}} with just {{content}} if content already has tags
-            # Or wrap content in <p> tags if it's plain text.
-            # Assuming content might contain paragraphs already, let's just replace {{content}}
-            # and adjust the template slightly if needed. The template has <p></p>{{content}}
-            # which might result in an empty paragraph before the content. Let's fix that in the template reading.
-            # A better approach is to split content by \n and wrap each line in <p>
-            processed_content = "".join([f"<p>{line}</p>" for line in content.split('\n') if line.strip()])
-
-            html_content = html_content.replace('<p></p>{{content}}', processed_content) # Replace the specific template part
-            # Also replace the next chapter link placeholder
-            html_content = html_content.replace("{{ '%04d' % (index + 1) }}", f"{(index + 1):04d}")
+            if self._template_text is None:
+                raise FileNotFoundError(self.template_path)
 
-
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
+            # A better approach is to split content by \n and wrap each line in <p>
+            processed_content = _P_WRAP.sub(_P_REPL, content).replace('\n', '')
+
+            # Replace all placeholders in a single pass over the cached
+            # template text (see _TEMPLATE_RE) instead of one scan each
+            replacements = {
+                '{{book}}': str(book),
+                '{{title}}': str(title),
+                '<p></p>{{content}}': processed_content,
+                "{{ '%04d' % (index + 1) }}": f"{(index + 1):04d}",
+            }
+            html_content = _TEMPLATE_RE.sub(lambda m: replacements[m.group(0)], self._template_text)
+
+            # Encode once and write the bytes directly; skips the
+            # TextIOWrapper's incremental encode/buffer loop
+            with open(output_path, 'wb') as f:
+                f.write(html_content.encode('utf-8'))
 
             print(f"Successfully saved HTML to {output_path}", file=sys.stderr)
             return output_path
@@ -324,12 +503,14 @@ class Translate:
             print(f"An error occurred while saving HTML to {output_path}: {e}", file=sys.stderr)
             return None
 
-    def run(self, json_path):
+    def run(self, json_path, overwrite=False):
         """
         Orchestrates the translation process for a single JSON file.
 
         Args:
             json_path: Path to the input JSON file.
+            overwrite: If False (default), skip files whose output HTML
+                       already exists instead of re-translating them.
 
         Returns:
             The path to the generated HTML file on success, None on failure.
@@ -347,6 +528,13 @@ class Translate:
         index = content_data['index']
         title = content_data['title']
 
+        # Idempotency: reruns skip chapters that are already on disk, which
+        # turns re-invocations over a whole book into stat calls, not LLM calls
+        expected_path = os.path.join('.', book, f"{index:04d}.html")
+        if not overwrite and os.path.exists(expected_path):
+            print(f"Output already exists, skipping: {expected_path}", file=sys.stderr)
+            return expected_path
+
         # 2. Translate content
         translated_content = self.translate_content(original_content)
         if translated_content is None:
@@ -368,3 +556,67 @@ class Translate:
 
         print(f"Successfully processed {json_path}. Output: {output_html_path}", file=sys.stderr)
         return output_html_path
+
+    def run_many(self, json_paths):
+        """
+        Processes several JSON files through a staged pipeline.
+
+        Stages (load -> translate+validate -> write) run as concurrent tasks
+        connected by bounded queues, so JSON parsing and HTML writing overlap
+        with in-flight LLM calls instead of idling between them. Worker count
+        comes from the TRANSLATE_WORKERS environment variable (default 4).
+
+        Args:
+            json_paths: Iterable of input JSON file paths.
+
+        Returns:
+            List of output HTML paths (or None per failed file), in input order.
+        """
+        return asyncio.run(self._run_many_async(list(json_paths)))
+
+    async def _run_many_async(self, json_paths):
+        n_translators = int(os.environ.get('TRANSLATE_WORKERS', '4'))
+        # maxsize bounds give backpressure: a slow stage stalls its producer
+        # instead of letting parsed-but-untranslated content pile up in memory
+        load_q = asyncio.Queue(maxsize=8)
+        write_q = asyncio.Queue(maxsize=8)
+        results = {}
+
+        async def loader():
+            for path in json_paths:
+                content_data = await asyncio.to_thread(self.extract_content, path)
+                if content_data is None:
+                    results[path] = None
+                    continue
+                await load_q.put((path, content_data))
+            for _ in range(n_translators):
+                await load_q.put(None)  # One stop marker per translator
+
+        async def translator():
+            while (item := await load_q.get()) is not None:
+                path, content_data = item
+                # translate_content is synchronous (retry/split logic); run it
+                # in a worker thread so other stages keep moving meanwhile
+                translated = await asyncio.to_thread(self.translate_content, content_data['content'])
+                if translated is None or not self.validate_result(content_data['content'], translated):
+                    print(f"Failed to translate or validate {path}", file=sys.stderr)
+                    results[path] = None
+                    continue
+                await write_q.put((path, content_data, translated))
+            await write_q.put(None)
+
+        async def writer():
+            remaining = n_translators
+            while remaining:
+                item = await write_q.get()
+                if item is None:
+                    remaining -= 1
+                    continue
+                path, content_data, translated = item
+                results[path] = await asyncio.to_thread(
+                    self.save_html,
+                    content_data['book'], content_data['index'], content_data['title'], translated
+                )
+
+        await asyncio.gather(loader(), *(translator() for _ in range(n_translators)), writer())
+        return [results.get(path) for path in json_paths]
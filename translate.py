@@ -1,18 +1,172 @@
 import os
+import atexit
+import bisect
+import hashlib
+import string
 import json
+import mmap
 from pathlib import Path
+from collections import deque
 from typing import Optional, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
 import jinja2
 import re
+from markupsafe import escape
+import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+import functools
+import random
+import threading
 import time
 import logging
 
+# orjson parses straight from bytes (no utf-8 decode pass) several times
+# faster than stdlib json; fall back to stdlib when it is not installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def parse_json(buf):
+    """Parses a JSON document from bytes or str via orjson when available."""
+    if orjson is not None:
+        return orjson.loads(buf)
+    return json.loads(buf)
+
+
+def dump_json(obj) -> bytes:
+    """Serializes a request body to bytes via orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+
+# Placeholder spliced out of the prebuilt request-body scaffold; NUL cannot
+# occur in a prompt or chunk, so its escaped form appears exactly once
+_BODY_MARKER = "\x00CHUNK\x00"
+
+
+def load_json(path: str) -> dict:
+    """Parses a JSON file, memory-mapping it to skip the read-buffer copy."""
+    with open(path, 'rb') as f:
+        if orjson is None:
+            return json.load(f)
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return orjson.loads(memoryview(mm))
+        except ValueError:
+            # Empty files cannot be mmapped
+            return orjson.loads(f.read())
+
+# tiktoken gives exact token counts for OpenAI-compatible models; without it
+# a bytes-per-token proxy (dense CJK text runs ~2 bytes per token) keeps the
+# packing roughly on target.
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
 load_dotenv()
 MAX_RETRIES = 5
-RETRY_DELAY = 5
 MAX_CHUNK_SIZE = 500
-INITIAL_CHUNK_LINES = 50
+# Chunks are packed to a token budget rather than a fixed line count, so
+# short-line dialogue fills the context instead of fragmenting into many
+# calls and long paragraphs do not overshoot into retry splits
+TARGET_TOKENS = int(os.environ.get("TARGET_TOKENS", "1500"))
+_token_encoder = None
+
+
+def estimate_tokens(text: str) -> int:
+    global _token_encoder
+    if tiktoken is not None:
+        if _token_encoder is None:
+            _token_encoder = tiktoken.get_encoding("cl100k_base")
+        return len(_token_encoder.encode(text))
+    return max(1, len(text.encode('utf-8')) // 2)
+# Chunks merged into one LLM call; each call pays fixed TLS/queue/prefill
+# overhead, so batching K chunks amortizes it K-fold. 1 disables batching.
+BATCH_CHUNKS = int(os.environ.get("BATCH_CHUNKS", "4"))
+# Batches are also capped by total character size so merged requests stay
+# well inside the model's context window regardless of chunk line lengths
+BATCH_CHAR_BUDGET = int(os.environ.get("BATCH_CHAR_BUDGET", "12000"))
+BATCH_INSTRUCTION = (
+    "The input below contains multiple independent segments, each wrapped in "
+    "<<<SEG n>>> and <<<END n>>> markers. Translate every segment separately "
+    "and wrap each translation in the same markers."
+)
+SEG_RE = re.compile(r"<<<SEG (\d+)>>>(.*?)<<<END \1>>>", re.DOTALL)
+# Paragraph wrapping as one C-level regex pass instead of a Python-level
+# f-string per line; [^\n]+ naturally skips empty lines.
+P_WRAP = re.compile(r"[^\n]+")
+P_REPL = r"<p>\g<0></p>"
+# Book names become directory names; anything outside [\w_-] is replaced.
+# ASCII names take a str.translate fast path; the regex keeps \w's unicode
+# semantics for everything else.
+SANITIZE_RE = re.compile(r'[^\w_\-]')
+_SAFE_CHARS = set(string.ascii_letters + string.digits + '_-')
+_SANITIZE_TABLE = {ord(c): '_' for c in map(chr, range(128)) if c not in _SAFE_CHARS}
+
+
+def sanitize_book(name: str) -> str:
+    if name.isascii():
+        return name.translate(_SANITIZE_TABLE)
+    return SANITIZE_RE.sub('_', name)
+
+
+class FatalTranslationError(Exception):
+    """HTTP error that retries cannot heal (bad key, bad model, oversized
+    payload); splitting the chunk further would fail identically."""
+
+
+def retry_delay(attempt: int, exc: Exception) -> float:
+    """Backoff before the next retry: jittered exponential, but deferring to
+    the provider's Retry-After header on 429/503 when it gives one."""
+    delay = min(2 ** attempt + random.random(), 30)
+    response = getattr(exc, 'response', None)
+    if response is not None and getattr(response, 'status_code', None) in (429, 503):
+        try:
+            retry_after = float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            retry_after = None
+        if retry_after is not None:
+            # Jitter on top so a fleet of workers does not return in lockstep
+            delay = min(retry_after + random.random(), 60)
+    return delay
+# Translations are pure functions of (model, prompt, chunk), so they are
+# cached on disk by content hash: retries and reruns of the same file skip
+# the LLM entirely. Disable with --no-cache.
+CACHE_DIR = Path(".translate_cache")
+# Book directories already created this process; batch wrappers that build
+# one processor per file still skip the repeat mkdir syscalls
+CREATED_DIRS = set()
+# One shared Jinja environment: compiled templates are cached per process,
+# auto_reload=False skips the per-render stat of the template file, and the
+# bytecode cache persists compiled templates across process invocations.
+# jinja2 expects the bytecode cache directory to already exist.
+Path('.jinja_cache').mkdir(exist_ok=True)
+TEMPLATE_ENV = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(searchpath="templates"),
+    auto_reload=False,
+    cache_size=50,
+    bytecode_cache=jinja2.FileSystemBytecodeCache('.jinja_cache'),
+)
+
+
+@functools.lru_cache(maxsize=32)
+def resolve_template(source: str, bookid: str) -> jinja2.Template:
+    """Resolves the most specific template for a (source, bookid) pair."""
+    try:
+        # select_template walks the candidates in one loader pass
+        return TEMPLATE_ENV.select_template([
+            f"{source}-{bookid}.html",
+            f"{source}.html",
+            "default.html"
+        ])
+    except jinja2.exceptions.TemplatesNotFound:
+        raise RuntimeError("No valid template found")
 
 logging.basicConfig(
     level=logging.INFO,
@@ -20,129 +174,451 @@ logging.basicConfig(
     handlers=[logging.StreamHandler()]
 )
 
+# One pooled session per process, shared by every processor: batch runs keep
+# warm TCP+TLS connections across all the chapters of a novel instead of
+# paying the handshakes again for each file.
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def get_session(pool_size: int) -> requests.Session:
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({'Content-Type': 'application/json'})
+            atexit.register(session.close)
+            _SESSION = session
+        return _SESSION
+
 class TranslationProcessor:
-    def __init__(self, input_file: str):
+    def __init__(self, input_file: str, use_cache: bool = True, overwrite: bool = False):
         self.input_file = input_file
-        self.template_loader = jinja2.FileSystemLoader(searchpath="templates")
-        self.template_env = jinja2.Environment(loader=self.template_loader)
+        self.use_cache = use_cache
+        self.overwrite = overwrite
+        # LLM configuration is fixed for the process lifetime; read it once
+        # instead of hitting os.environ on every chunk.
+        self.llm_model = os.environ.get('LLM_MODEL')
+        self.llm_prompt = os.environ.get('LLM_PROMPT')
+        self.llm_token = os.environ.get('LLM_TOKEN')
+        self.llm_url = os.environ.get('LLM_URL')
+        self.llm_provider = os.environ.get('LLM_PROVIDER')
+        # Request URL and auth headers depend only on the configuration, so
+        # build them once here; a missing configuration surfaces immediately
+        # instead of after the content has been split.
+        if all([self.llm_model, self.llm_prompt, self.llm_token, self.llm_url]):
+            if self.llm_provider == 'gemini':
+                self.request_url = f"{self.llm_url.rstrip('/')}/v1beta/models/{self.llm_model}:generateContent?key={self.llm_token}"
+                # Content-Type comes from the session defaults
+                self.request_headers = {}
+                scaffold = {"contents": [{"parts": [{"text": f"{self.llm_prompt}\n\n{_BODY_MARKER}"}]}]}
+            else:
+                self.request_url = f"{self.llm_url.rstrip('/')}/chat/completions"
+                self.request_headers = {'Authorization': f'Bearer {self.llm_token}'}
+                scaffold = {
+                    "model": self.llm_model,
+                    "messages": [{"role": "user", "content": f"{self.llm_prompt}\n\n{_BODY_MARKER}"}],
+                    "stream": True,
+                }
+            # The static body (model, stream flag, the prompt itself — often
+            # kilobytes) is serialized once; per chunk only the chunk's own
+            # JSON-escaped text is spliced between the two halves.
+            marker_escaped = dump_json(_BODY_MARKER)[1:-1]
+            self._body_prefix, self._body_suffix = dump_json(scaffold).split(marker_escaped)
+        else:
+            logging.error("Missing LLM configuration")
+            self.request_url = None
+            self.request_headers = None
         self.successful_chunks = []
         self.original_line_count = 0
-        self.original_content = ""
+        # Per-chunk validation metrics accumulated as chunks complete, so
+        # validate_completion never has to re-scan the full translated text.
+        # Only metrics of the original are kept, not the content itself, so
+        # the source text is not held resident for the whole run.
+        self.translated_non_empty_lines = 0
+        self.translated_char_count = 0
+        self.original_non_empty_lines = 0
+        self.original_char_count = 0
         self.source, self.bookid, self.index = self.parse_filename(input_file)
         self.generated_file = None
+        # Chunks have no data dependency, so they are translated concurrently.
+        # One shared session reuses pooled TCP+TLS connections across threads.
+        self.concurrency = int(os.environ.get("TRANSLATE_CONCURRENCY", "8"))
+        # LLM_BATCH=1: send the whole chapter as one segmented request (the
+        # system prompt is paid once); per-chunk fallback still applies to any
+        # segment missing from the response.
+        self.batch_all = os.environ.get("LLM_BATCH") == "1"
+        self.session = get_session(self.concurrency)
+        self._chunks_lock = threading.Lock()
+        # httpx.AsyncClient for the async fan-out path; created lazily inside
+        # the event loop and only when httpx is installed.
+        self._async_client = None
 
     def parse_filename(self, filename: str) -> tuple[str, str, str]:
         parts = Path(filename).stem.split('-')
         return parts[0], parts[1], parts[2]
     
     def get_template(self) -> jinja2.Template:
-        templates_to_try = [
-            f"{self.source}-{self.bookid}.html",
-            f"{self.source}.html",
-            "default.html"
-        ]
-        for template_name in templates_to_try:
-            try:
-                return self.template_env.get_template(template_name)
-            except jinja2.exceptions.TemplateNotFound:
-                continue
-        raise RuntimeError("No valid template found")
+        return resolve_template(self.source, self.bookid)
 
-    def split_content(self, content: str) -> List[Tuple[str, List[int]]]:
+    def split_content(self, content: str) -> List[Tuple[Tuple[str, ...], List[int]]]:
+        # Chunks travel through the pipeline as tuples of lines: the content
+        # is split exactly once here, splitting a failed chunk is a slice
+        # instead of a split+join, and the text is only joined back together
+        # at request-build time.
         lines = content.split('\n')
         self.original_line_count = len(lines)
-        self.original_content = content
-        return [
-            ('\n'.join(lines[i:i + INITIAL_CHUNK_LINES]), [i // INITIAL_CHUNK_LINES + 1])
-            for i in range(0, len(lines), INITIAL_CHUNK_LINES)
-        ]
-    
-    def split_chunk(self, chunk: str, indices: List[int]) -> List[Tuple[str, List[int]]]:
-        lines = chunk.split('\n')
-        mid = len(lines) // 2
+        self.original_non_empty_lines = sum(1 for line in lines if line.strip())
+        self.original_char_count = len(content)
+        # Greedy token packing: lines accumulate until the next one would
+        # push the chunk past TARGET_TOKENS
+        chunks = []
+        current = []
+        current_tokens = 0
+        for line in lines:
+            line_tokens = estimate_tokens(line)
+            if current and current_tokens + line_tokens > TARGET_TOKENS:
+                chunks.append((tuple(current), [len(chunks) + 1]))
+                current = []
+                current_tokens = 0
+            current.append(line)
+            current_tokens += line_tokens
+        if current:
+            chunks.append((tuple(current), [len(chunks) + 1]))
+        return chunks
+
+    def split_chunk(self, chunk: Tuple[str, ...], indices: List[int]) -> List[Tuple[Tuple[str, ...], List[int]]]:
+        mid = len(chunk) // 2
         return [
-            ('\n'.join(lines[:mid]), indices + [1]),
-            ('\n'.join(lines[mid:]), indices + [2])
+            (chunk[:mid], indices + [1]),
+            (chunk[mid:], indices + [2])
         ]
     
-    def translate_chunk(self, chunk: str, retry_count: int = 0) -> Optional[str]:
-        llm_model = os.environ.get('LLM_MODEL')
-        llm_prompt = os.environ.get('LLM_PROMPT')
-        llm_token = os.environ.get('LLM_TOKEN')
-        llm_url = os.environ.get('LLM_URL')
-        llm_provider = os.environ.get('LLM_PROVIDER')
-
-        if not all([llm_model, llm_prompt, llm_token, llm_url]):
+    def cache_key(self, chunk: str) -> str:
+        blob = f"{self.llm_model}\0{self.llm_prompt}\0{chunk}".encode('utf-8')
+        return hashlib.blake2b(blob, digest_size=16).hexdigest()
+
+    def cache_path(self, chunk: str) -> Path:
+        # Two-level sharding (first hex byte as subdirectory) keeps any one
+        # directory small when the cache grows to many thousands of entries
+        key = self.cache_key(chunk)
+        return CACHE_DIR / key[:2] / f"{key[2:]}.txt"
+
+    def cache_get(self, chunk: str) -> Optional[str]:
+        if not self.use_cache:
+            return None
+        try:
+            return self.cache_path(chunk).read_text(encoding='utf-8')
+        except OSError:
+            return None
+
+    def cache_put(self, chunk: str, translated: str):
+        if not self.use_cache:
+            return
+        try:
+            path = self.cache_path(chunk)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(translated, encoding='utf-8')
+        except OSError:
+            pass  # Best-effort cache; translation still succeeded
+
+    def build_request(self, chunk: str) -> Optional[Tuple[str, dict, bytes]]:
+        if self.request_url is None:
             logging.error("Missing LLM configuration")
             return None
 
-        import requests
-
-        if llm_provider == 'gemini':
-            headers = {'Content-Type': 'application/json'}
-            data = {
-                    "contents": [
-                    {
-                        "parts": [
-                        {
-                            "text": f"{llm_prompt}\n\n{chunk}"
-                        }
-                        ]
-                    }
-                    ]
-                }
-            url = f"{llm_url.rstrip('/')}/v1beta/models/{llm_model}:generateContent?key={llm_token}"
-        else:
-            headers = {'Authorization': f'Bearer {llm_token}', 'Content-Type': 'application/json'}
-            data = {
-                "model": llm_model,
-                "messages": [{"role": "user", "content": f"{llm_prompt}\n\n{chunk}"}],
-                "stream": False,
-            }
-            url = f"{llm_url.rstrip('/')}/chat/completions"
+        # Splice the JSON-escaped chunk (dump_json of the bare string, quotes
+        # stripped) into the prebuilt scaffold: no per-call dict construction
+        # and no re-serialization of the static prompt
+        body = self._body_prefix + dump_json(chunk)[1:-1] + self._body_suffix
+        return self.request_url, self.request_headers, body
 
-        try:
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            if llm_provider == 'gemini':
+    def extract_translation(self, body: dict) -> str:
+        if self.llm_provider == 'gemini':
     #               "candidates": [
     # {
     #   "content": {
     #     "parts": [
     #       {
     #         "text":
-                translated = response.json()['candidates'][0]['content']['parts'][0]['text']
-            else:
-                translated = response.json()['choices'][0]['message']['content']
-            
-            if not translated.strip():
-                raise ValueError("Received empty translation")
-                
-            return translated
-        except Exception as e:
-            if retry_count < MAX_RETRIES:
-                logging.warning(f"Retrying chunk (attempt {retry_count + 1}): {e}")
-                time.sleep(RETRY_DELAY)
-                return self.translate_chunk(chunk, retry_count + 1)
-            logging.error(f"Final translation failure: {e}")
+            translated = body['candidates'][0]['content']['parts'][0]['text']
+        else:
+            translated = body['choices'][0]['message']['content']
+
+        if not translated.strip():
+            raise ValueError("Received empty translation")
+
+        return translated
+
+    def extract_stream(self, lines) -> str:
+        parts = []
+        for raw in lines:
+            if not raw:
+                continue
+            line = raw.decode('utf-8') if isinstance(raw, bytes) else raw
+            if not line.startswith('data:'):
+                continue
+            frame = line[5:].strip()
+            if frame == '[DONE]':
+                break
+            delta = parse_json(frame)['choices'][0].get('delta', {})
+            parts.append(delta.get('content') or '')
+
+        translated = ''.join(parts)
+        if not translated.strip():
+            raise ValueError("Received empty translation")
+
+        return translated
+
+    def translate_chunk(self, chunk: str) -> Optional[str]:
+        cached = self.cache_get(chunk)
+        if cached is not None:
+            return cached
+
+        request = self.build_request(chunk)
+        if request is None:
             return None
-    
-    def process_chunk(self, chunk: str, indices: List[int]) -> bool:
-        translated = self.translate_chunk(chunk)
-        if translated:
-            self.successful_chunks.append((indices, translated))
-            return True
-
-        if len(chunk) < MAX_CHUNK_SIZE:
-            logging.error(f"Failed to translate minimum-size chunk: {indices}")
-            return False
+        url, headers, body = request
+
+        last_error = None
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                if self.llm_provider == 'gemini':
+                    # generateContent is not an SSE endpoint; keep the blocking call
+                    response = self.session.post(url, headers=headers, data=body)
+                    response.raise_for_status()
+                    # Parse the raw bytes with orjson; skips requests/httpx's
+                    # str decode plus the slower stdlib parser
+                    translated = self.extract_translation(parse_json(response.content))
+                else:
+                    # Consume SSE deltas as the model decodes instead of blocking on
+                    # the full completion; the connection frees up as soon as the last
+                    # token arrives, letting the pool start the next queued chunk.
+                    with self.session.post(url, headers=headers, data=body, stream=True) as response:
+                        response.raise_for_status()
+                        translated = self.extract_stream(response.iter_lines())
+                self.cache_put(chunk, translated)
+                return translated
+            except Exception as e:
+                # 4xx other than 429 will not heal with retries, and splitting
+                # the chunk would just repeat it: abort the whole file
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                if status is not None and 400 <= status < 500 and status != 429:
+                    raise FatalTranslationError(f"HTTP {status}: {e}") from e
+                last_error = e
+                if attempt < MAX_RETRIES:
+                    logging.warning(f"Retrying chunk (attempt {attempt + 1}): {e}")
+                    time.sleep(retry_delay(attempt, e))
+
+        logging.error(f"Final translation failure: {last_error}")
+        return None
+
+    async def translate_chunk_async(self, chunk: str) -> Optional[str]:
+        # Cache file I/O goes through the default thread pool so a disk read
+        # never stalls the event loop under the other in-flight requests
+        cached = await asyncio.to_thread(self.cache_get, chunk)
+        if cached is not None:
+            return cached
+
+        request = self.build_request(chunk)
+        if request is None:
+            return None
+        url, headers, body = request
+
+        import httpx
+        if self._async_client is None:
+            # HTTP/2 multiplexes the concurrent chunk requests over one TLS
+            # connection; keep-alive caps stop idle sockets piling up.
+            limits = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+            client_headers = {'Content-Type': 'application/json'}
+            try:
+                self._async_client = httpx.AsyncClient(
+                    http2=True,
+                    timeout=httpx.Timeout(120.0),
+                    limits=limits,
+                    headers=client_headers
+                )
+            except ImportError:
+                # http2 extra (h2) not installed; HTTP/1.1 keep-alive still
+                # reuses pooled connections
+                self._async_client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(120.0),
+                    limits=limits,
+                    headers=client_headers
+                )
+
+        last_error = None
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                if self.llm_provider == 'gemini':
+                    # generateContent is not an SSE endpoint; keep the plain call
+                    response = await self._async_client.post(url, headers=headers, content=body)
+                    response.raise_for_status()
+                    # Parse the raw bytes with orjson; skips requests/httpx's
+                    # str decode plus the slower stdlib parser
+                    translated = self.extract_translation(parse_json(response.content))
+                else:
+                    async with self._async_client.stream("POST", url, headers=headers, content=body) as response:
+                        response.raise_for_status()
+                        lines = [line async for line in response.aiter_lines()]
+                    translated = self.extract_stream(lines)
+                await asyncio.to_thread(self.cache_put, chunk, translated)
+                return translated
+            except Exception as e:
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                if status is not None and 400 <= status < 500 and status != 429:
+                    raise FatalTranslationError(f"HTTP {status}: {e}") from e
+                last_error = e
+                if attempt < MAX_RETRIES:
+                    logging.warning(f"Retrying chunk (attempt {attempt + 1}): {e}")
+                    await asyncio.sleep(retry_delay(attempt, e))
+
+        logging.error(f"Final translation failure: {last_error}")
+        return None
 
-        sub_chunks = self.split_chunk(chunk, indices)
-        for sub_chunk, sub_indices in sub_chunks:
-            if not self.process_chunk(sub_chunk, sub_indices):
+    def record_chunk(self, indices: List[int], translated: str):
+        # Compute validation metrics once per chunk while the text is hot in
+        # cache; validate_completion then just sums them.
+        non_empty = sum(1 for line in translated.split('\n') if line.strip())
+        with self._chunks_lock:
+            # Keep the list ordered as chunks land (indices compare
+            # lexicographically), so nothing downstream has to re-sort it.
+            bisect.insort(self.successful_chunks, (indices, translated))
+            self.translated_non_empty_lines += non_empty
+            self.translated_char_count += len(translated)
+
+    def process_chunk(self, chunk: Tuple[str, ...], indices: List[int]) -> bool:
+        # Explicit work queue instead of recursion: a failed chunk's halves
+        # are pushed back to the front, keeping document order without
+        # stacking a Python frame per split level.
+        queue = deque([(chunk, indices)])
+        while queue:
+            chunk, indices = queue.popleft()
+            # Joined once here, at the edge of the HTTP path
+            text = '\n'.join(chunk)
+            translated = self.translate_chunk(text)
+            if translated:
+                self.record_chunk(indices, translated)
+                continue
+
+            if len(text) < MAX_CHUNK_SIZE:
+                logging.error(f"Failed to translate minimum-size chunk: {indices}")
                 return False
+
+            queue.extendleft(reversed(self.split_chunk(chunk, indices)))
         return True
-    
+
+    async def process_chunk_async(self, chunk: Tuple[str, ...], indices: List[int]) -> bool:
+        queue = deque([(chunk, indices)])
+        while queue:
+            chunk, indices = queue.popleft()
+            text = '\n'.join(chunk)
+            translated = await self.translate_chunk_async(text)
+            if translated:
+                self.record_chunk(indices, translated)
+                continue
+
+            if len(text) < MAX_CHUNK_SIZE:
+                logging.error(f"Failed to translate minimum-size chunk: {indices}")
+                return False
+
+            queue.extendleft(reversed(self.split_chunk(chunk, indices)))
+        return True
+
+    def build_batches(self, chunks: List[Tuple[Tuple[str, ...], List[int]]], batch_size: int) -> List[List[Tuple[Tuple[str, ...], List[int]]]]:
+        # Greedy windows capped by both chunk count and total characters, so a
+        # run of unusually long lines cannot push a merged request past the
+        # model's context budget.
+        batches = []
+        current = []
+        current_chars = 0
+        for chunk, indices in chunks:
+            chunk_chars = sum(len(line) + 1 for line in chunk)
+            if current and (len(current) >= batch_size or current_chars + chunk_chars > BATCH_CHAR_BUDGET):
+                batches.append(current)
+                current = []
+                current_chars = 0
+            current.append((chunk, indices))
+            current_chars += chunk_chars
+        if current:
+            batches.append(current)
+        return batches
+
+    def build_batch_prompt(self, batch: List[Tuple[Tuple[str, ...], List[int]]]) -> str:
+        segments = "\n\n".join(
+            "<<<SEG {0}>>>\n{1}\n<<<END {0}>>>".format(n, '\n'.join(chunk))
+            for n, (chunk, _) in enumerate(batch, 1)
+        )
+        return f"{BATCH_INSTRUCTION}\n\n{segments}"
+
+    def parse_batch_response(self, translated: Optional[str]) -> dict:
+        if not translated:
+            return {}
+        return {int(m.group(1)): m.group(2).strip('\n') for m in SEG_RE.finditer(translated)}
+
+    def process_batch(self, batch: List[Tuple[Tuple[str, ...], List[int]]]) -> bool:
+        if len(batch) == 1:
+            ok = self.process_chunk(*batch[0])
+        else:
+            translated = self.translate_chunk(self.build_batch_prompt(batch))
+            found = self.parse_batch_response(translated)
+            ok = True
+            for n, (chunk, indices) in enumerate(batch, 1):
+                segment = found.get(n, '')
+                if segment.strip():
+                    self.record_chunk(indices, segment)
+                else:
+                    # Segment missing or empty in the batched response: fall back
+                    # to translating just this chunk on its own.
+                    logging.warning(f"Batched response missing segment {n}; retrying chunk {indices} alone")
+                    if not self.process_chunk(chunk, indices):
+                        ok = False
+        if ok:
+            # Source lines are no longer needed once the translations are in
+            # successful_chunks; clearing here lets them go before the rest of
+            # the file finishes, keeping peak memory near one in-flight batch
+            batch.clear()
+        return ok
+
+    async def process_batch_async(self, batch: List[Tuple[Tuple[str, ...], List[int]]]) -> bool:
+        if len(batch) == 1:
+            ok = await self.process_chunk_async(*batch[0])
+        else:
+            translated = await self.translate_chunk_async(self.build_batch_prompt(batch))
+            found = self.parse_batch_response(translated)
+            ok = True
+            for n, (chunk, indices) in enumerate(batch, 1):
+                segment = found.get(n, '')
+                if segment.strip():
+                    self.record_chunk(indices, segment)
+                else:
+                    logging.warning(f"Batched response missing segment {n}; retrying chunk {indices} alone")
+                    if not await self.process_chunk_async(chunk, indices):
+                        ok = False
+        if ok:
+            batch.clear()
+        return ok
+
+    async def process_batches_async(self, batches: List[List[Tuple[Tuple[str, ...], List[int]]]]) -> List[List[int]]:
+        # Bound the in-flight requests: gather alone would fire every batch at
+        # once and trip provider rate limits on large files
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(batch):
+            async with semaphore:
+                return await self.process_batch_async(batch)
+
+        try:
+            results = await asyncio.gather(*(bounded(batch) for batch in batches))
+            return [indices for batch, ok in zip(batches, results) if not ok for _, indices in batch]
+        finally:
+            if self._async_client is not None:
+                await self._async_client.aclose()
+                self._async_client = None
+
     def save_debug_files(self, original: str, translated: str):
         debug_dir = Path("test")
         debug_dir.mkdir(exist_ok=True)
@@ -157,14 +633,13 @@ class TranslationProcessor:
         logging.info(f"Debug files saved: {original_path}, {translated_path}")
 
     def validate_completion(self) -> bool:
-        sorted_chunks = sorted(self.successful_chunks, key=lambda x: x[0])
-        translated_content = '\n'.join([chunk for _, chunk in sorted_chunks])
-
-        # Count non-empty lines and characters in original and translated content
-        original_non_empty_lines = sum(1 for line in self.original_content.split('\n') if line.strip())
-        translated_non_empty_lines = sum(1 for line in translated_content.split('\n') if line.strip())
-        original_char_count = len(self.original_content)
-        translated_char_count = len(translated_content)
+        # Metrics were accumulated chunk-by-chunk in record_chunk, so this is
+        # O(num_chunks) instead of three passes over the full translated text.
+        original_non_empty_lines = self.original_non_empty_lines
+        translated_non_empty_lines = self.translated_non_empty_lines
+        original_char_count = self.original_char_count
+        # Account for the '\n' joiners between chunks in the final document
+        translated_char_count = self.translated_char_count + max(0, len(self.successful_chunks) - 1)
 
         line_diff_within_tolerance = True
         if original_non_empty_lines != translated_non_empty_lines:
@@ -186,7 +661,12 @@ class TranslationProcessor:
                     logging.warning(f"Character count difference within 10% tolerance: {original_char_count} vs {translated_char_count}")
 
         if not line_diff_within_tolerance and not char_diff_within_tolerance:
-            self.save_debug_files(self.original_content, translated_content)
+            # Only the failure path needs the joined text, for the debug dump
+            translated_content = '\n'.join([chunk for _, chunk in self.successful_chunks])
+            # Re-read the source only now: the failure path is rare and this
+            # keeps the full original out of memory during the run
+            original_content = load_json(self.input_file)['content']
+            self.save_debug_files(original_content, translated_content)
             logging.error("Content validation failed: Both line count and character count differences are outside tolerance.")
             return False
 
@@ -194,50 +674,127 @@ class TranslationProcessor:
         return True
 
     def process_file(self) -> Optional[str]:
-        with open(self.input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            self.original_content = data['content']
+        data = load_json(self.input_file)
 
-        chunks = self.split_content(data['content'])
-        for chunk, indices in chunks:
-            if not self.process_chunk(chunk, indices):
-                logging.error("Aborting due to failed chunk")
-                return None
+        # Idempotency: if this chapter's HTML is already on disk, skip the
+        # whole translation. Reruns over a book cost stat calls, not LLM calls.
+        book_dir = Path(sanitize_book(data['book']))
+        output_file = book_dir / f"{int(self.index):04d}.html"
+        if output_file.exists() and not self.overwrite:
+            logging.info(f"Output already exists, skipping: {output_file}")
+            self.generated_file = output_file
+            return str(output_file)
+
+        # pop() drops the dict's reference so the full source string can be
+        # freed as soon as it has been split into chunks
+        chunks = self.split_content(data.pop('content'))
+        # Merge chunks into batches so one LLM call covers several of them,
+        # then fan the batches out concurrently; ordering is restored later by
+        # sorting successful_chunks on their indices. Prefer the async client
+        # (overlaps all requests on one thread) and fall back to the thread
+        # pool when httpx is not installed.
+        batch_size = len(chunks) if self.batch_all else max(1, BATCH_CHUNKS)
+        batches = self.build_batches(chunks, batch_size)
+        # The batch lists now hold the only references to the source chunks;
+        # without this, the clears in process_batch would free nothing
+        del chunks
+        # The shared session stays open between files (closed at process
+        # exit), so back-to-back chapters reuse its warm connections.
+        try:
+            try:
+                import httpx  # noqa: F401 - availability probe only
+                failed = asyncio.run(self.process_batches_async(batches))
+            except ImportError:
+                max_workers = max(1, min(self.concurrency, len(batches)))
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = {}
+                    for batch in batches:
+                        # Capture indices before submitting: a finished worker
+                        # clears its batch to release the source lines
+                        batch_indices = [indices for _, indices in batch]
+                        futures[executor.submit(self.process_batch, batch)] = batch_indices
+                    failed = [indices for future in as_completed(futures) if not future.result() for indices in futures[future]]
+        except FatalTranslationError as e:
+            # A config-level failure (bad key, wrong model) fails every chunk
+            # identically; stop the file instead of retrying and splitting
+            logging.error(f"Aborting file on unrecoverable error: {e}")
+            return None
+        if failed:
+            logging.error(f"Aborting due to failed chunks: {sorted(failed)}")
+            return None
 
         if not self.validate_completion():
             logging.error("Content validation failed")
             return None
 
-        book_dir = Path(re.sub(r'[^\w_\-]', '_', data['book']))
-        book_dir.mkdir(parents=True, exist_ok=True)
-        
-        sorted_chunks = [chunk for _, chunk in sorted(self.successful_chunks, key=lambda x: x[0])]
+        if book_dir not in CREATED_DIRS:
+            book_dir.mkdir(parents=True, exist_ok=True)
+            CREATED_DIRS.add(book_dir)
+
+        sorted_chunks = [chunk for _, chunk in self.successful_chunks]
         template = self.get_template()
-        rendered = template.render(
+        self.generated_file = output_file
+        # stream().dump() writes the HTML block by block instead of
+        # materializing the full rendered document next to the content string
+        template.stream(
             title=data['title'],
-            content=''.join(f'<p>{line}</p>' for line in "\n".join(sorted_chunks).split("\n")),
+            # Wrap per chunk instead of joining everything first: skips one
+            # full copy of the translated text before the regex pass. Chunks
+            # are escaped first so raw LLM output cannot inject markup.
+            # str() drops the Markup wrapper so re.sub does not re-escape the tags
+            content='\n'.join(P_WRAP.sub(P_REPL, str(escape(chunk))) for chunk in sorted_chunks),
             url=data['url'],
             source=data['source'],
             index=int(self.index),
             book=data['book']
-        )
-        
-        self.generated_file = book_dir / f"{int(self.index):04d}.html"
-        with open(self.generated_file, 'w', encoding='utf-8') as f:
-            f.write(rendered)
-        
+        ).dump(str(self.generated_file), encoding='utf-8')
+
         return str(self.generated_file)
 
+def _process_one(input_file: str, use_cache: bool, overwrite: bool) -> Optional[str]:
+    # Module-level so ProcessPoolExecutor can pickle it; each worker process
+    # keeps its jinja environment, session pool and caches warm across files.
+    processor = TranslationProcessor(input_file, use_cache=use_cache, overwrite=overwrite)
+    return processor.process_file()
+
+
 if __name__ == "__main__":
     import sys
-    if len(sys.argv) != 2:
-        print("Usage: python translate.py <input_file>")
+    import glob
+    args = sys.argv[1:]
+    use_cache = '--no-cache' not in args
+    overwrite = '--overwrite' in args
+    args = [arg for arg in args if arg not in ('--no-cache', '--overwrite')]
+    if not args:
+        print("Usage: python translate.py [--no-cache] [--overwrite] <input_file> [input_file ...]")
+        sys.exit(1)
+
+    # Expand globs the shell did not (e.g. quoted patterns on CI)
+    files = [path for arg in args for path in (sorted(glob.glob(arg)) if any(c in arg for c in '*?[') else [arg])]
+    if not files:
+        print(f"No input files matched: {' '.join(args)}")
         sys.exit(1)
 
-    processor = TranslationProcessor(sys.argv[1])
-    result = processor.process_file()
-    if result:
-        print(f"GENERATED_FILE:{result}")
-        sys.exit(0)
-    else:
-        sys.exit(1)
\ No newline at end of file
+    if len(files) == 1:
+        result = _process_one(files[0], use_cache, overwrite)
+        if result:
+            print(f"GENERATED_FILE:{result}")
+            sys.exit(0)
+        sys.exit(1)
+
+    # Batch mode: one worker process per CPU, each amortizing interpreter
+    # startup and warm state over many files. Network concurrency within a
+    # file still comes from the async/thread fan-out in process_file.
+    from concurrent.futures import ProcessPoolExecutor
+    worker = functools.partial(_process_one, use_cache=use_cache, overwrite=overwrite)
+    max_workers = min(len(files), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(worker, files))
+    failures = [path for path, result in zip(files, results) if not result]
+    for path, result in zip(files, results):
+        if result:
+            print(f"GENERATED_FILE:{result}")
+    if failures:
+        logging.error(f"Failed files: {failures}")
+        sys.exit(1)
+    sys.exit(0)
\ No newline at end of file